@@ -0,0 +1,97 @@
+"""
+Semantic answer cache for QueryView.
+
+An answer is reused when a new question
+- is asked in the same category,
+- retrieves the same context (same vector ids, same order), and
+- has a query embedding within ANSWER_CACHE_THRESHOLD cosine similarity of
+  the cached question,
+and the entry is younger than ANSWER_CACHE_TTL. Entries of a category are
+dropped whenever documents of that category are ingested, replaced,
+re-categorized or deleted; entries of unfiltered queries are dropped on
+every such change.
+"""
+
+import hashlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AnswerCacheEntry
+
+answer_cache_stats = {"lookups": 0, "hits": 0, "misses": 0}
+
+
+def enabled():
+    return settings.ANSWER_CACHE_TTL > 0
+
+
+def context_fingerprint(matches):
+    """Fingerprint of the retrieved context: the ranked vector ids."""
+    ids = "\n".join(m["id"] for m in matches)
+    return hashlib.sha256(ids.encode("utf-8")).hexdigest()
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def lookup_answer(vector, category, fingerprint):
+    """Return the best cached answer for this question, or None."""
+    if not enabled():
+        return None
+    answer_cache_stats["lookups"] += 1
+
+    rows = list(
+        AnswerCacheEntry.objects.filter(
+            category=category or "",
+            context_fingerprint=fingerprint,
+            expires_at__gt=timezone.now(),
+        ).order_by("-created_at").values_list("id", "query_vector", "answer")[:settings.ANSWER_CACHE_SCAN_LIMIT]
+    )
+    query = _unit(vector)
+    best, best_score = None, settings.ANSWER_CACHE_THRESHOLD
+    for row_id, blob, answer in rows:
+        cached = np.frombuffer(bytes(blob), dtype=np.float32)
+        if cached.shape != query.shape:
+            continue  # embedded with another model
+        score = float(cached @ query)
+        if score >= best_score:
+            best, best_score = (row_id, answer), score
+
+    if best is None:
+        answer_cache_stats["misses"] += 1
+        return None
+
+    answer_cache_stats["hits"] += 1
+    AnswerCacheEntry.objects.filter(id=best[0]).update(hits=F("hits") + 1)
+    print(f" Answer cache hit (similarity {best_score:.3f})")
+    return best[1]
+
+
+def store_answer(vector, category, fingerprint, question, answer):
+    if not enabled():
+        return
+    now = timezone.now()
+    AnswerCacheEntry.objects.filter(expires_at__lte=now).delete()
+    AnswerCacheEntry.objects.create(
+        category=category or "",
+        context_fingerprint=fingerprint,
+        query_vector=_unit(vector).tobytes(),
+        question=question,
+        answer=answer,
+        expires_at=now + timedelta(seconds=settings.ANSWER_CACHE_TTL),
+    )
+
+
+def invalidate_answers(*categories):
+    """Drop cached answers that may draw on documents of these categories."""
+    tags = {c or "" for c in categories}
+    deleted, _ = AnswerCacheEntry.objects.filter(Q(category__in=tags) | Q(category="")).delete()
+    if deleted:
+        print(f" Answer cache: dropped {deleted} entries for categories {sorted(tags)}")
@@ -0,0 +1,330 @@
+"""
+Ingestion benchmark harness.
+
+Runs the real ingestion code end to end against local stand-ins, so
+throughput can be measured without AWS, OpenAI, Pinecone or ElevenLabs:
+
+- FakeS3: in-process object store with the boto3 calls ingestion makes
+- FakeOpenAI: deterministic embeddings with a configurable per-request latency
+- FakeRedis: the debounce flag and lock of the KB sync
+
+Vectors go to a real LocalStore (see vectorstores) in a scratch directory.
+
+Used by `manage.py benchmark_ingestion`, which also runs everything in a
+throwaway test database with Celery in eager mode.
+"""
+
+import hashlib
+import os
+import random
+import resource
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+WORDS = (
+    "light energy healing water body mind balance nature spirit breath earth "
+    "harmony frequency cell root herb sleep practice awareness sound rhythm "
+    "garden season growth ancient modern science study measure signal field "
+    "pattern memory community equity future system learning quantum wave "
+    "source silence morning evening river mountain path journey clarity"
+).split()
+
+
+# ---------- Fakes ----------
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def iter_lines(self):
+        yield from self._data.splitlines()
+
+
+class FakeS3:
+    """Dict-backed stand-in for the boto3 S3 client calls used by ingestion."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self._lock:
+            self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket, Key, f.read())
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": _Body(self.objects[Key])}
+
+    def download_fileobj(self, Bucket, Key, Fileobj, Callback=None):
+        data = self.objects[Key]
+        for i in range(0, len(data), 1024 * 1024):
+            block = data[i:i + 1024 * 1024]
+            Fileobj.write(block)
+            if Callback:
+                Callback(len(block))
+
+    def download_file(self, Bucket, Key, Filename):
+        with open(Filename, "wb") as f:
+            self.download_fileobj(Bucket, Key, f)
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket, obj["Key"])
+
+    def get_paginator(self, name):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix=""):
+                keys = [k for k in list(s3.objects) if k.startswith(Prefix)]
+                yield {"Contents": [{"Key": k} for k in keys]}
+
+        return Paginator()
+
+
+def fake_embedding(text, dimensions):
+    """Deterministic unit vector for `text`."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+class FakeOpenAI:
+    """Stand-in for `client.embeddings.create` with a fixed request latency."""
+
+    def __init__(self, latency_ms=150, dimensions=1536):
+        self.latency = latency_ms / 1000
+        self.dimensions = dimensions
+        self.requests = 0
+        self.inputs = 0
+        self.embeddings = self
+        self._lock = threading.Lock()
+
+    def create(self, model, input, dimensions=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            self.inputs += len(input)
+        dims = dimensions or self.dimensions
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, dims))
+            for i, text in enumerate(input)
+        ])
+
+
+class FakeRedis:
+    """The few Redis calls made by the KB sync."""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(m.encode() for m in members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(m.encode() for m in members)
+
+    def lock(self, name, timeout=None):
+        return threading.Lock()
+
+
+@contextmanager
+def local_services(s3, openai, store):
+    """Patch every external client used by ingestion with the given fakes and vector store."""
+    patches = [
+        mock.patch("chatbot.ingest_artifacts.s3_client", return_value=s3),
+        mock.patch("chatbot.embedding_utils.get_openai", return_value=openai),
+        mock.patch("chatbot.pinecone_utils.get_vector_store", return_value=store),
+        mock.patch("chatbot.tasks.create_kb_doc", side_effect=lambda text, **kwargs: {
+            "type": "text", "name": "benchmark", "id": f"kb-{uuid.uuid4()}", "usage_mode": "prompt",
+        }),
+        mock.patch("chatbot.tasks.update_agent_knowledge_base"),
+        mock.patch("chatbot.tasks.delete_kb_docs"),
+        mock.patch("chatbot.tasks.get_redis", return_value=FakeRedis()),
+        mock.patch("chatbot.utils_process.get_s3", return_value=s3),
+        mock.patch("chatbot.utils_process.get_vector_store", return_value=store),
+    ]
+    with ExitStack() as stack:
+        for p in patches:
+            stack.enter_context(p)
+        yield
+
+
+# ---------- Memory ----------
+
+def _current_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Sample the resident set size in the background and keep the peak."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+
+# ---------- Corpus ----------
+
+def _paragraphs(rng, count):
+    for n in range(count):
+        if n % 4 == 0:
+            yield f"{n // 4 + 1}. {' '.join(rng.choice(WORDS) for _ in range(4)).title()}"
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 22))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        yield " ".join(sentences)
+
+
+def _page_lines(rng, width=90, lines_per_page=48):
+    lines = []
+    for para in _paragraphs(rng, 12):
+        line = ""
+        for word in para.split():
+            if len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines += [line, ""]
+        if len(lines) >= lines_per_page:
+            break
+    return lines[:lines_per_page]
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages):
+    """Write a minimal PDF with a real text layer; `pages` is a list of line lists."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in pages:
+        body = "BT /F1 10 Tf 13 TL 50 760 Td " + " ".join(
+            f"({_pdf_escape(line)}) Tj T*" for line in lines
+        ) + " ET"
+        content = body.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_scanned_pdf(path, pages, dpi=150):
+    """Write an image-only PDF (rendered text, no text layer) that needs OCR."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default(size=dpi // 7)
+    images = []
+    for lines in pages:
+        img = Image.new("L", (int(8.5 * dpi), 11 * dpi), 255)
+        draw = ImageDraw.Draw(img)
+        for n, line in enumerate(lines):
+            draw.text((dpi // 2, dpi // 2 + n * dpi // 5), line, fill=0, font=font)
+        images.append(img)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=dpi)
+
+
+def build_corpus(out_dir, text_pages=40, pdf_pages=40, scanned_pages=6, seed=7):
+    """Generate the benchmark corpus. Returns [(kind, path, pages)]."""
+    rng = random.Random(seed)
+    corpus = []
+
+    path = os.path.join(out_dir, "notes.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(text_pages):
+            f.write("\n".join(_page_lines(rng)) + "\n\n")
+    corpus.append(("text", path, text_pages))
+
+    path = os.path.join(out_dir, "digital.pdf")
+    write_text_pdf(path, [_page_lines(rng) for _ in range(pdf_pages)])
+    corpus.append(("digital pdf", path, pdf_pages))
+
+    if scanned_pages:
+        path = os.path.join(out_dir, "scanned.pdf")
+        write_scanned_pdf(path, [_page_lines(rng, width=70, lines_per_page=40) for _ in range(scanned_pages)])
+        corpus.append(("scanned pdf", path, scanned_pages))
+    return corpus
@@ -0,0 +1,169 @@
+import re
+from collections import namedtuple
+from typing import List
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+from .embedding_utils import get_encoding
+
+# A piece of text that is never split further unless it is too long on its own
+Unit = namedtuple("Unit", "text tokens heading new_paragraph page", defaults=(None,))
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*"                        # markdown heading
+    r"|[A-Z0-9][A-Z0-9 ,:;&'’\-]{2,80}"       # ALL CAPS line
+    r"|(\d+(\.\d+)*\.?|[IVXLC]+\.)\s+[A-Z].{0,80})$"  # numbered section
+)
+
+
+class ChunkStats:
+    """Running statistics over the chunks produced by a TokenChunker."""
+
+    def __init__(self, target_tokens):
+        self.target_tokens = target_tokens
+        self.chunks = 0
+        self.tokens = 0
+        self.overlap_tokens = 0
+        self.min_tokens = None
+        self.max_tokens = 0
+
+    def add(self, tokens, overlap):
+        self.chunks += 1
+        self.tokens += tokens
+        self.overlap_tokens += overlap
+        self.min_tokens = tokens if self.min_tokens is None else min(self.min_tokens, tokens)
+        self.max_tokens = max(self.max_tokens, tokens)
+
+    def as_dict(self):
+        avg = self.tokens / self.chunks if self.chunks else 0
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "avg_tokens": round(avg, 1),
+            "min_tokens": self.min_tokens or 0,
+            "max_tokens": self.max_tokens,
+            "fill_ratio": round(avg / self.target_tokens, 3) if self.target_tokens else 0,
+            "overlap_ratio": round(self.overlap_tokens / self.tokens, 3) if self.tokens else 0,
+        }
+
+    def __str__(self):
+        d = self.as_dict()
+        return (
+            f"{d['chunks']} chunks, {d['tokens']} tokens "
+            f"(avg {d['avg_tokens']}, min {d['min_tokens']}, max {d['max_tokens']}, "
+            f"fill {d['fill_ratio']:.0%}, overlap {d['overlap_ratio']:.0%})"
+        )
+
+
+class TokenChunker:
+    """
+    Split text into chunks measured in embedding-model tokens.
+
+    Text is broken into headings and sentences, which are packed greedily
+    until the next one would exceed `chunk_tokens`. A heading starts a new
+    chunk once the current one is at least half full, and consecutive
+    chunks share up to `overlap_tokens` of trailing sentences (never across
+    a heading). Sentences longer than a whole chunk are cut on token
+    boundaries. `split_pages` packs the pages of a document as one stream,
+    so chunks fill up across page breaks. `stats` accumulates over every call.
+    """
+
+    def __init__(self, chunk_tokens=None, overlap_tokens=None):
+        self.chunk_tokens = chunk_tokens or settings.CHUNK_TOKENS
+        self.overlap_tokens = min(
+            overlap_tokens if overlap_tokens is not None else settings.CHUNK_OVERLAP_TOKENS,
+            self.chunk_tokens // 2,
+        )
+        self.encoding = get_encoding()
+        self.stats = ChunkStats(self.chunk_tokens)
+
+    def _count(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _units(self, text, page=None):
+        for paragraph in _PARAGRAPH_RE.split(text):
+            lines = [line.strip() for line in paragraph.splitlines() if line.strip()]
+            if not lines:
+                continue
+
+            new_paragraph = True
+            if len(lines[0]) <= 80 and _HEADING_RE.match(lines[0]):
+                yield Unit(lines[0], self._count(lines[0]), True, True, page)
+                lines = lines[1:]
+                new_paragraph = False
+
+            for sentence in _SENTENCE_RE.split(" ".join(lines)):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                tokens = self.encoding.encode(sentence, disallowed_special=())
+                if len(tokens) <= self.chunk_tokens:
+                    yield Unit(sentence, len(tokens), False, new_paragraph, page)
+                else:
+                    for i in range(0, len(tokens), self.chunk_tokens):
+                        window = tokens[i:i + self.chunk_tokens]
+                        yield Unit(self.encoding.decode(window), len(window), False,
+                                   new_paragraph and i == 0, page)
+                new_paragraph = False
+
+    def _emit(self, units, overlap):
+        """Join units into a chunk. Returns (page of the first unit, text)."""
+        text = units[0].text
+        for prev, unit in zip(units, units[1:]):
+            if unit.new_paragraph or unit.heading:
+                sep = "\n\n"
+            else:
+                sep = "\n" if prev.heading else " "
+            text += sep + unit.text
+        tokens = sum(u.tokens for u in units)
+        overlap_tokens = sum(u.tokens for u in units[:overlap])
+        self.stats.add(tokens, overlap_tokens)
+        return units[0].page, text
+
+    def _overlap_tail(self, units):
+        tail, tokens = [], 0
+        for unit in reversed(units):
+            if unit.heading or tokens + unit.tokens > self.overlap_tokens:
+                break
+            tail.insert(0, unit)
+            tokens += unit.tokens
+        return tail
+
+    def _pack(self, units):
+        current, current_tokens, overlap = [], 0, 0
+
+        for unit in units:
+            full = current_tokens + unit.tokens > self.chunk_tokens
+            section_break = unit.heading and current_tokens >= self.chunk_tokens // 2
+            if current and len(current) > overlap and (full or section_break):
+                yield self._emit(current, overlap)
+                current = [] if unit.heading else self._overlap_tail(current)
+                current_tokens = sum(u.tokens for u in current)
+                if current_tokens + unit.tokens > self.chunk_tokens:
+                    current, current_tokens = [], 0
+                overlap = len(current)
+            current.append(unit)
+            current_tokens += unit.tokens
+
+        if len(current) > overlap:
+            yield self._emit(current, overlap)
+
+    def split_text(self, text) -> List[str]:
+        return [chunk for _, chunk in self._pack(self._units(text))]
+
+    def split_pages(self, pages):
+        """
+        Chunk (page, text) pairs as one continuous text. Yields (page, chunk),
+        where page is the page the chunk starts on.
+        """
+        yield from self._pack(unit for page, text in pages for unit in self._units(text, page))
+
+    def split_documents(self, docs) -> List[Document]:
+        return [
+            Document(page_content=chunk, metadata=dict(doc.metadata))
+            for doc in docs
+            for chunk in self.split_text(doc.page_content)
+        ]
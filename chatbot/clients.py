@@ -0,0 +1,163 @@
+"""
+Process-wide upstream clients.
+
+SDK clients are created lazily on first use and then shared by every view
+and task in the process, so their connection pools (keep-alive, HTTP/2
+when the `h2` package is installed) survive across requests instead of
+paying a TLS handshake per call. All clients are thread-safe.
+
+The registry is emptied in a forked child (Celery prefork workers, gunicorn
+--preload), so a child never reuses sockets opened by its parent.
+"""
+
+import os
+import threading
+
+import boto3
+import httpx
+import redis
+from botocore.config import Config
+from django.conf import settings
+from elevenlabs.client import ElevenLabs
+from openai import OpenAI
+from pinecone import Pinecone
+
+_clients = {}
+_name_locks = {}
+_lock = threading.Lock()  # guards _name_locks and reset_clients
+
+
+def _after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _name_locks.clear()
+    # Drop, don't close: the parent still owns these connections
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _get(name, factory):
+    """
+    The client registered as `name`, built by `factory` on first use.
+    Each name has its own lock, so a factory may itself call _get for
+    another client (e.g. the Pinecone index needs the Pinecone client).
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            name_lock = _name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _http_client():
+    return httpx.Client(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(settings.UPSTREAM_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_openai():
+    return _get("openai", lambda: OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=_http_client(),
+        max_retries=settings.UPSTREAM_MAX_RETRIES,
+    ))
+
+
+def get_elevenlabs():
+    return _get("elevenlabs", lambda: ElevenLabs(
+        api_key=settings.ELEVENLABS_API_KEY,
+        httpx_client=_http_client(),
+    ))
+
+
+def get_http():
+    """Shared httpx client for plain HTTP calls to upstream APIs."""
+    return _get("http", _http_client)
+
+
+def get_s3():
+    return _get("s3", lambda: boto3.client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        config=Config(
+            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout=settings.UPSTREAM_TIMEOUT,
+            retries={"max_attempts": settings.UPSTREAM_MAX_RETRIES + 1, "mode": "standard"},
+        ),
+    ))
+
+
+def _pinecone():
+    if settings.PINECONE_GRPC:
+        try:
+            from pinecone.grpc import PineconeGRPC
+            return PineconeGRPC(api_key=settings.PINECONE_API_KEY)
+        except ImportError:
+            print(" pinecone[grpc] is not installed; using the REST transport")
+    return Pinecone(api_key=settings.PINECONE_API_KEY)
+
+
+def get_pinecone():
+    return _get("pinecone", _pinecone)
+
+
+def pinecone_index_host():
+    """
+    Data-plane host of PINECONE_INDEX_NAME. Taken from PINECONE_INDEX_HOST
+    if set, otherwise resolved with one describe_index call per process.
+    """
+    if settings.PINECONE_INDEX_HOST:
+        return settings.PINECONE_INDEX_HOST
+    return _get("pinecone-host", lambda: get_pinecone().describe_index(settings.PINECONE_INDEX_NAME).host)
+
+
+def get_pinecone_index():
+    return _get("pinecone-index", lambda: get_pinecone().Index(host=pinecone_index_host()))
+
+
+def get_vector_store():
+    """The VECTOR_BACKEND index (see vectorstores)."""
+    from .vectorstores import make_vector_store
+    return _get("vector-store", make_vector_store)
+
+
+def get_redis():
+    return _get("redis", lambda: redis.Redis.from_url(settings.REDIS_URL))
+
+
+def reset_clients():
+    """Close and forget every client, e.g. after rotating API keys."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
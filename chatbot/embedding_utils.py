@@ -0,0 +1,396 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import tiktoken
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from langchain_core.embeddings import Embeddings
+
+from .clients import get_openai, get_redis
+from .models import EmbeddingCache
+
+# Hard limits of the embeddings endpoint
+MAX_INPUT_TOKENS = 8191
+MAX_REQUEST_INPUTS = 2048
+
+_encoding = None
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(settings.EMBEDDING_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def _prepare(texts: List[str]):
+    """
+    Token-count every text, truncating anything above the per-input limit.
+    Returns a list of (text, token_count).
+    """
+    enc = get_encoding()
+    prepared = []
+    for text in texts:
+        text = text or " "
+        tokens = enc.encode(text, disallowed_special=())
+        if len(tokens) > MAX_INPUT_TOKENS:
+            tokens = tokens[:MAX_INPUT_TOKENS]
+            text = enc.decode(tokens)
+        prepared.append((text, len(tokens)))
+    return prepared
+
+
+def make_batches(texts: List[str]):
+    """
+    Pack texts into request-sized batches, keeping the original order.
+    A batch is closed when adding the next text would exceed
+    EMBEDDING_BATCH_MAX_TOKENS or EMBEDDING_BATCH_MAX_INPUTS.
+    """
+    max_tokens = settings.EMBEDDING_BATCH_MAX_TOKENS
+    max_inputs = min(settings.EMBEDDING_BATCH_MAX_INPUTS, MAX_REQUEST_INPUTS)
+
+    batches = []
+    current, current_tokens = [], 0
+    for text, n_tokens in _prepare(texts):
+        if current and (current_tokens + n_tokens > max_tokens or len(current) >= max_inputs):
+            batches.append((current, current_tokens))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += n_tokens
+    if current:
+        batches.append((current, current_tokens))
+    return batches
+
+
+def _embed_batch(batch_no, total, inputs, n_tokens):
+    kwargs = {}
+    if settings.EMBEDDING_DIMENSIONS:
+        kwargs["dimensions"] = settings.EMBEDDING_DIMENSIONS
+
+    start = time.perf_counter()
+    res = get_openai().embeddings.create(model=settings.EMBEDDING_MODEL, input=inputs, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"→ Embedding batch {batch_no}/{total}: {len(inputs)} chunks, "
+        f"{n_tokens} tokens in {elapsed * 1000:.0f} ms"
+    )
+    # The API may return items out of order, so sort on the index it echoes back
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)], elapsed
+
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many texts with as few requests as possible.
+
+    Texts are packed into token-bounded batches and up to
+    EMBEDDING_MAX_IN_FLIGHT batches are sent concurrently. The returned
+    vectors are in the same order as `texts`.
+    """
+    if not texts:
+        return []
+
+    batches = make_batches(texts)
+    total = len(batches)
+    workers = max(1, min(settings.EMBEDDING_MAX_IN_FLIGHT, total))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda args: _embed_batch(args[0] + 1, total, *args[1]),
+            enumerate(batches),
+        ))
+    wall = time.perf_counter() - start
+
+    vectors = []
+    latencies = []
+    for batch_vectors, elapsed in results:
+        vectors.extend(batch_vectors)
+        latencies.append(elapsed)
+
+    latencies.sort()
+    print(
+        f"Embedded {len(vectors)} chunks in {total} batches "
+        f"({workers} in flight) in {wall:.2f}s — "
+        f"batch p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+        f"max {latencies[-1] * 1000:.0f} ms"
+    )
+    return vectors
+
+
+# ---------- Content-addressed cache ----------
+
+_LOOKUP_CHUNK = 500  # stay below SQLite's bound-parameter limit
+
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _cache_scope():
+    return {
+        "model": settings.EMBEDDING_MODEL,
+        "dimensions": settings.EMBEDDING_DIMENSIONS,
+    }
+
+
+def _cache_lookup(hashes):
+    found = {}
+    for i in range(0, len(hashes), _LOOKUP_CHUNK):
+        part = hashes[i:i + _LOOKUP_CHUNK]
+        rows = EmbeddingCache.objects.filter(
+            text_hash__in=part, **_cache_scope()
+        ).values_list("id", "text_hash", "vector")
+        ids = []
+        for row_id, h, vector in rows:
+            found[h] = np.frombuffer(bytes(vector), dtype=np.float32).tolist()
+            ids.append(row_id)
+        if ids:
+            EmbeddingCache.objects.filter(id__in=ids).update(
+                hits=F("hits") + 1, last_used_at=timezone.now()
+            )
+    return found
+
+
+def _cache_store(items):
+    rows = [
+        EmbeddingCache(
+            text_hash=h,
+            vector=np.asarray(vector, dtype=np.float32).tobytes(),
+            **_cache_scope(),
+        )
+        for h, vector in items
+    ]
+    try:
+        EmbeddingCache.objects.bulk_create(rows, batch_size=_LOOKUP_CHUNK, ignore_conflicts=True)
+    except IntegrityError:
+        pass
+
+
+def evict_cache():
+    """
+    Drop the least recently used rows once the cache is over its size
+    limit. Counting the table is not cheap, so this runs periodically
+    (tasks.evict_embedding_cache) rather than on every store.
+    """
+    limit = settings.EMBEDDING_CACHE_MAX_ENTRIES
+    if not limit:
+        return 0
+    overflow = EmbeddingCache.objects.count() - limit
+    if overflow <= 0:
+        return 0
+    stale = EmbeddingCache.objects.order_by("last_used_at").values_list("id", flat=True)[:overflow]
+    deleted, _ = EmbeddingCache.objects.filter(id__in=list(stale)).delete()
+    print(f"Embedding cache evicted {deleted} entries")
+    return deleted
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts through the persistent cache.
+
+    Every embedding path (ingestion and queries) goes through here, so a
+    text that was embedded before with the same model and dimensions is
+    never sent to the API again. Order of the result matches `texts`.
+    """
+    if not texts:
+        return []
+
+    hashes = [text_hash(t) for t in texts]
+    found = _cache_lookup(list(set(hashes)))
+
+    missing = {}
+    for text, h in zip(texts, hashes):
+        if h not in found and h not in missing:
+            missing[h] = text
+
+    hits = len(texts) - sum(1 for h in hashes if h not in found)
+    cache_stats["hits"] += hits
+    cache_stats["misses"] += len(texts) - hits
+    print(f"Embedding cache: {hits} hits, {len(texts) - hits} misses ({len(missing)} unique)")
+
+    if missing:
+        new_vectors = _embed_uncached(list(missing.values()))
+        new_items = list(zip(missing.keys(), new_vectors))
+        _cache_store(new_items)
+        found.update(new_items)
+
+    return [found[h] for h in hashes]
+
+
+# ---------- Query embedding cache ----------
+
+query_cache_stats = {
+    "lookups": 0,
+    "lru_hits": 0,
+    "shared_hits": 0,
+    "misses": 0,
+    "saved_seconds": 0.0,
+    "miss_seconds_avg": 0.0,
+}
+
+_query_lru = OrderedDict()
+# Guards the LRU, query_cache_stats and the unflushed shared counters
+_query_lru_lock = threading.Lock()
+_SHARED_STATS = ("lookups", "hits", "misses", "saved_ms")
+_SHARED_FLUSH_SECONDS = 10
+_shared_pending = Counter()
+_shared_flushed_at = 0.0
+
+
+def normalize_query(text: str) -> str:
+    """Case-, whitespace- and punctuation-insensitive form of a query."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(c).startswith("P") else c for c in text)
+    return " ".join(text.split())
+
+
+def _query_key(text):
+    h = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+    return f"qemb:{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSIONS}:{h}"
+
+
+def _lru_get(key):
+    with _query_lru_lock:
+        vector = _query_lru.get(key)
+        if vector is not None:
+            _query_lru.move_to_end(key)
+        return vector
+
+
+def _lru_put(key, vector):
+    with _query_lru_lock:
+        _query_lru[key] = vector
+        _query_lru.move_to_end(key)
+        while len(_query_lru) > settings.QUERY_EMBED_LRU_SIZE:
+            _query_lru.popitem(last=False)
+
+
+def _flush_shared_stats(force=False):
+    """Add the counts collected since the last flush to the shared counters, in one round trip."""
+    global _shared_flushed_at
+    with _query_lru_lock:
+        if not _shared_pending or (not force and time.monotonic() - _shared_flushed_at < _SHARED_FLUSH_SECONDS):
+            return
+        pending = dict(_shared_pending)
+        _shared_pending.clear()
+        _shared_flushed_at = time.monotonic()
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for name, n in pending.items():
+            pipe.incrby(f"qemb:stats:{name}", n)
+        pipe.execute()
+    except Exception as e:
+        print(" Shared query cache stats not updated:", e)
+
+
+def _shared_incr(**counts):
+    """Count towards the shared stats; flushed every _SHARED_FLUSH_SECONDS, not per query."""
+    with _query_lru_lock:
+        _shared_pending.update(counts)
+    _flush_shared_stats()
+
+
+def _record_query_hit(tier):
+    with _query_lru_lock:
+        saved = query_cache_stats["miss_seconds_avg"]
+        query_cache_stats["lookups"] += 1
+        query_cache_stats[f"{tier}_hits"] += 1
+        query_cache_stats["saved_seconds"] += saved
+    _shared_incr(lookups=1, hits=1, saved_ms=int(saved * 1000))
+
+
+def embed_query(text: str) -> List[float]:
+    """
+    Embed a user query through a two-tier cache: an in-process LRU, then
+    the shared cache (all workers), then `embed_texts`. Queries that differ
+    only in case, whitespace or punctuation share an entry.
+    """
+    key = _query_key(text)
+    vector = _lru_get(key)
+    if vector is not None:
+        _record_query_hit("lru")
+        return vector
+
+    try:
+        blob = caches["shared"].get(key)
+    except Exception as e:
+        print(" Shared query cache unavailable:", e)
+        blob = None
+    if blob is not None:
+        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+        _lru_put(key, vector)
+        _record_query_hit("shared")
+        return vector
+
+    started = time.perf_counter()
+    vector = embed_texts([text])[0]
+    elapsed = time.perf_counter() - started
+
+    with _query_lru_lock:
+        query_cache_stats["lookups"] += 1
+        misses = query_cache_stats["misses"] = query_cache_stats["misses"] + 1
+        avg = query_cache_stats["miss_seconds_avg"]
+        query_cache_stats["miss_seconds_avg"] = avg + (elapsed - avg) / misses
+    _shared_incr(lookups=1, misses=1)
+
+    _lru_put(key, vector)
+    try:
+        caches["shared"].set(
+            key, np.asarray(vector, dtype=np.float32).tobytes(), timeout=settings.QUERY_EMBED_CACHE_TTL
+        )
+    except Exception as e:
+        print(" Shared query cache unavailable:", e)
+    return vector
+
+
+def query_cache_report():
+    """
+    Hit ratio and saved latency, for this process and across all processes
+    (the latter include other processes' counts up to _SHARED_FLUSH_SECONDS late).
+    """
+    with _query_lru_lock:
+        local = dict(query_cache_stats)
+        local["lru_entries"] = len(_query_lru)
+    hits = local["lru_hits"] + local["shared_hits"]
+    local["hit_ratio"] = round(hits / local["lookups"], 4) if local["lookups"] else 0.0
+    local["saved_seconds"] = round(local["saved_seconds"], 3)
+    local["miss_seconds_avg"] = round(local["miss_seconds_avg"], 4)
+
+    _flush_shared_stats(force=True)
+    try:
+        values = get_redis().mget([f"qemb:stats:{n}" for n in _SHARED_STATS])
+        shared = {n: int(v or 0) for n, v in zip(_SHARED_STATS, values)}
+        shared["hit_ratio"] = round(shared["hits"] / shared["lookups"], 4) if shared["lookups"] else 0.0
+        shared["saved_seconds"] = round(shared.pop("saved_ms") / 1000, 3)
+    except Exception as e:
+        shared = {"error": str(e)}
+    return {"process": local, "all_processes": shared}
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain adapter so vector stores embed through `embed_texts`."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return embed_texts(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return embed_query(text)
@@ -1,98 +1,272 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import docx
 import PyPDF2
 import pytesseract
+from django.conf import settings
 from PIL import Image
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 
-def extract_text_from_file(path):
-    print("======================================")
-    print("🔍 DEBUGGING EXTRACTOR STARTED")
-    print(f"📄 File Path: {path}")
-    print("======================================")
-
-    # ------------------------------
-    # 1️⃣ PDF Extract
-    # ------------------------------
-    if path.endswith(".pdf"):
-        text = ""
-        print("📁 PDF detected. Trying PyPDF2 extract...")
+from .media_utils import is_media, iter_media_transcript
 
-        try:
-            reader = PyPDF2.PdfReader(path)
-            print(f"📄 Total PDF Pages: {len(reader.pages)}")
+# One tesseract process per page; keep each single-threaded so that
+# OCR_WORKERS parallel pages do not oversubscribe the CPU.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
 
-            for i, page in enumerate(reader.pages):
-                print(f"➡️ Extracting Page {i+1} with PyPDF2...")
-                extracted = page.extract_text()
-                print(f"    ↳ Extracted Length: {len(extracted) if extracted else 0}")
+PROGRESS_EVERY = 50            # pages between progress lines
+TEXT_BLOCK_CHARS = 64 * 1024   # size of the blocks yielded for TXT/DOCX
 
-                if extracted:
-                    text += extracted
 
-        except Exception as e:
-            print(f"❌ PyPDF2 ERROR: {e}")
-
-        print(f"📌 PyPDF2 Total Extracted Characters: {len(text)}")
-
-        # ------------------------------
-        # 2️⃣ OCR fallback
-        # ------------------------------
-        if len(text.strip()) == 0:
-            print("⚠️ No text found. Running OCR fallback...")
-            try:
-                print("⏳ Converting PDF → Images using pdf2image...")
-                images = convert_from_path(path, poppler_path="/usr/bin")
-                print(f"🖼️ Total Images Generated: {len(images)}")
-            except Exception as e:
-                print(f"❌ pdf2image ERROR: {e}")
-                return ""
-
-            print("🔍 Running OCR on each image...")
-
-            for idx, img in enumerate(images):
-                print(f"➡️ OCR on image {idx+1}/{len(images)}...")
-                try:
-                    ocr_text = pytesseract.image_to_string(img)
-                    print(f"    ↳ OCR Extracted Characters: {len(ocr_text)}")
-                    text += ocr_text
-                except Exception as e:
-                    print(f"❌ OCR ERROR on page {idx+1}: {e}")
+def page_text_ok(text):
+    """
+    Decide whether a page's text layer is usable or the page needs OCR.
+
+    A page fails when it has too few characters, too many unprintable or
+    replacement characters, a whitespace density typical of garbage layers
+    (glyphs run together, or mostly whitespace), or runs of non-whitespace
+    characters too short on average (one character per line or per word).
+    Scripts written without spaces (CJK, Thai, ...) are exempt from the
+    minimum whitespace check when they make up most of the letters.
+    """
+    stripped = text.strip()
+    if len(stripped) < settings.OCR_MIN_PAGE_CHARS:
+        return False
+
+    printable = sum(1 for c in stripped if (c.isprintable() or c in "\n\t") and c != "\ufffd")
+    if printable / len(stripped) < settings.OCR_MIN_PRINTABLE_RATIO:
+        return False
+
+    whitespace = sum(1 for c in stripped if c.isspace()) / len(stripped)
+    if whitespace > settings.OCR_MAX_WHITESPACE_RATIO:
+        return False
+
+    runs = stripped.split()
+    if sum(map(len, runs)) / len(runs) < settings.OCR_MIN_MEAN_RUN_LENGTH:
+        return False
+    return whitespace >= settings.OCR_MIN_WHITESPACE_RATIO or _mostly_non_latin(stripped)
+
+
+def _is_latin(c):
+    # Basic Latin through Latin Extended-B, and Latin Extended Additional
+    return c < "\u0250" or "\u1e00" <= c <= "\u1eff"
 
-        print(f"📌 FINAL Extracted Characters (PDF): {len(text)}")
-        print("======================================")
-        return text
 
-    # ------------------------------
-    # DOCX
-    # ------------------------------
-    if path.endswith(".docx"):
-        print("📁 DOCX detected.")
+def _mostly_non_latin(text):
+    letters = [c for c in text if c.isalpha()]
+    return bool(letters) and sum(1 for c in letters if not _is_latin(c)) > len(letters) / 2
+
+
+def _ocr_page_range(path, first_page, last_page):
+    """Rasterize and OCR one contiguous page range. Returns [(page, text, seconds)]."""
+    images = convert_from_path(
+        path,
+        poppler_path="/usr/bin",
+        first_page=first_page,
+        last_page=last_page,
+        dpi=settings.OCR_DPI,
+        grayscale=True,
+    )
+    results = []
+    for offset, img in enumerate(images):
+        start = time.perf_counter()
         try:
-            doc = docx.Document(path)
-            text = "\n".join([p.text for p in doc.paragraphs])
-            print(f"📌 Extracted DOCX Characters: {len(text)}")
+            text = pytesseract.image_to_string(img, config=settings.OCR_TESSERACT_CONFIG)
         except Exception as e:
-            print(f"❌ DOCX ERROR: {e}")
+            print(f"❌ OCR ERROR on page {first_page + offset}: {e}")
             text = ""
-        print("======================================")
-        return text
-
-    # ------------------------------
-    # TXT
-    # ------------------------------
-    if path.endswith(".txt"):
-        print("📁 TXT detected.")
+        finally:
+            img.close()
+        results.append((first_page + offset, text, time.perf_counter() - start))
+    return results
+
+
+def _drain(ordered, page_seconds, must_wait):
+    """
+    Yield finished pages from the head of `ordered` in page order.
+    Stops at an unfinished OCR range unless `must_wait()` is true.
+    """
+    while ordered:
+        page_no, item, layer_texts = ordered[0]
+        if not isinstance(item, Future):
+            ordered.popleft()
+            yield page_no, item
+            continue
+
+        if not item.done() and not must_wait():
+            return
+        ordered.popleft()
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                text = f.read()
-            print(f"📌 Extracted TXT Characters: {len(text)}")
+            results = item.result()
         except Exception as e:
-            print(f"❌ TXT ERROR: {e}")
+            print(f"❌ pdf2image ERROR on pages starting at {page_no}: {e}")
+            results = [(p, "", 0.0) for p in layer_texts]
+
+        for ocr_page, ocr_text, seconds in results:
+            page_seconds[ocr_page] = round(seconds, 3)
+            # Keep the weak text layer if OCR found nothing better
+            text = ocr_text if ocr_text.strip() else layer_texts.get(ocr_page, "")
+            if text:
+                yield ocr_page, text
+
+
+def _iter_pdf_pages(path, stats=None, start_page=1):
+    """
+    Hybrid text-layer/OCR extraction.
+
+    Every page is first read with PyPDF2; pages whose text fails
+    `page_text_ok` are OCR'd. Consecutive bad pages are grouped into ranges
+    of up to OCR_PAGES_PER_TASK pages and run on OCR_WORKERS threads while
+    the text layer of later pages is still being read. pdftoppm and
+    tesseract are child processes, so threads give real parallelism (and
+    work inside daemonized Celery workers, which may not fork process
+    pools). Output stays in page order; the number of OCR ranges in flight
+    and of pages waiting behind them is bounded.
+    """
+    print("📁 PDF detected. Reading text layer with PyPDF2...")
+    stats = stats if stats is not None else {}
+    sources = stats.setdefault("page_sources", {"text": [], "ocr": []})
+    page_seconds = stats.setdefault("ocr_page_seconds", {})
+
+    reader = None
+    try:
+        reader = PyPDF2.PdfReader(path)
+        page_count = len(reader.pages)
+    except Exception as e:
+        print(f"❌ PyPDF2 ERROR: {e}. Falling back to OCR for every page.")
+        try:
+            page_count = pdfinfo_from_path(path, poppler_path="/usr/bin")["Pages"]
+        except Exception as e:
+            print(f"❌ pdfinfo ERROR: {e}")
+            return
+    print(f"📄 Total PDF Pages: {page_count}")
+    stats["page_count"] = page_count
+
+    workers = max(1, settings.OCR_WORKERS)
+    range_size = max(1, settings.OCR_PAGES_PER_TASK)
+    max_buffered = workers * 2 * range_size + PROGRESS_EVERY
+    started = time.perf_counter()
+
+    ordered = deque()   # (first_page, text | Future, {page: weak layer text})
+    run = {}            # consecutive bad pages not yet submitted
+
+    def in_flight():
+        return sum(1 for _, item, _ in ordered if isinstance(item, Future))
+
+    def backlog_full():
+        return in_flight() >= workers * 2 or len(ordered) >= max_buffered
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit_run():
+            if run:
+                pages = sorted(run)
+                future = pool.submit(_ocr_page_range, path, pages[0], pages[-1])
+                ordered.append((pages[0], future, dict(run)))
+                run.clear()
+
+        for page_no in range(start_page, page_count + 1):
             text = ""
-        print("======================================")
-        return text
+            if reader is not None:
+                try:
+                    text = reader.pages[page_no - 1].extract_text() or ""
+                except Exception as e:
+                    print(f"❌ PyPDF2 ERROR on page {page_no}: {e}")
+
+            if page_text_ok(text):
+                submit_run()
+                ordered.append((page_no, text, None))
+                sources["text"].append(page_no)
+            else:
+                run[page_no] = text
+                sources["ocr"].append(page_no)
+                if len(run) >= range_size:
+                    submit_run()
+
+            if page_no % PROGRESS_EVERY == 0:
+                print(f"➡️ Read {page_no}/{page_count} pages "
+                      f"({len(sources['ocr'])} sent to OCR)")
+
+            yield from _drain(ordered, page_seconds, backlog_full)
+
+        submit_run()
+        yield from _drain(ordered, page_seconds, lambda: True)
+
+    print(f"📌 {len(sources['text'])} pages from text layer, "
+          f"{len(sources['ocr'])} pages OCR'd in {time.perf_counter() - started:.1f}s")
+    if page_seconds:
+        print(f"📌 OCR avg {sum(page_seconds.values()) / len(page_seconds):.2f}s/page, "
+              f"max {max(page_seconds.values()):.2f}s")
+
 
-    # Unknown type
-    print("⚠️ Unsupported file type.")
-    print("======================================")
-    return ""
+def _iter_docx_blocks(path):
+    print("📁 DOCX detected.")
+    try:
+        doc = docx.Document(path)
+    except Exception as e:
+        print(f"❌ DOCX ERROR: {e}")
+        return
+
+    block, size = [], 0
+    for p in doc.paragraphs:
+        block.append(p.text)
+        size += len(p.text) + 1
+        if size >= TEXT_BLOCK_CHARS:
+            yield None, "\n".join(block)
+            block, size = [], 0
+    if block:
+        yield None, "\n".join(block)
+
+
+def _iter_txt_blocks(path):
+    print("📁 TXT detected.")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            block, size = [], 0
+            for line in f:
+                block.append(line)
+                size += len(line)
+                if size >= TEXT_BLOCK_CHARS:
+                    yield None, "".join(block)
+                    block, size = [], 0
+            if block:
+                yield None, "".join(block)
+    except Exception as e:
+        print(f"❌ TXT ERROR: {e}")
+
+
+def iter_pages(path, stats=None, start_page=1):
+    """
+    Stream the text of a document as (page_number, text) pairs.
+
+    PDFs are yielded page by page (page numbers are 1-based). TXT and DOCX
+    have no pages, so they are yielded in ~64 KB blocks with page None.
+    Audio/video is transcribed and yielded one timestamped segment at a
+    time, also with page None.
+    Only one page or block is held in memory at a time.
+
+    If `stats` is a dict it is filled with extraction details: the PDF page
+    count under "page_count", which pages came from the text layer or OCR
+    under "page_sources", and per-page OCR seconds under "ocr_page_seconds".
+
+    `start_page` skips the PDF pages before it, to resume an interrupted
+    extraction. It is ignored for the other formats.
+    """
+    if path.endswith(".pdf"):
+        yield from _iter_pdf_pages(path, stats, start_page)
+    elif path.endswith(".docx"):
+        yield from _iter_docx_blocks(path)
+    elif path.endswith(".txt"):
+        yield from _iter_txt_blocks(path)
+    elif is_media(path):
+        print("📁 Audio/video detected.")
+        for text in iter_media_transcript(path):
+            yield None, text
+    else:
+        print("⚠️ Unsupported file type.")
+
+
+def extract_text_from_file(path):
+    """Return the whole document text. Prefer `iter_pages` for large files."""
+    return "".join(text for _, text in iter_pages(path))
@@ -0,0 +1,113 @@
+"""
+Intermediate ingestion artifacts.
+
+Stages of the ingestion workflow may run on different workers, so anything
+one stage hands to the next (page texts, chunk shards) is stored in S3 under
+INGEST_ARTIFACT_PREFIX/<record_id>/. The downloaded source file is kept in a
+per-record local work dir and re-downloaded if a stage lands on another host.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .clients import get_s3
+
+
+def s3_client():
+    return get_s3()
+
+
+def artifact_key(record_id, name):
+    return f"{settings.INGEST_ARTIFACT_PREFIX}/{record_id}/{name}"
+
+
+def work_dir(record_id):
+    path = os.path.join(settings.INGEST_WORK_DIR, str(record_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def clear_work_dir(record_id):
+    shutil.rmtree(os.path.join(settings.INGEST_WORK_DIR, str(record_id)), ignore_errors=True)
+
+
+def local_source(record_id, s3_key, progress=None):
+    """
+    Path of the downloaded source file, downloading it if this host has no
+    copy. `progress(bytes_done, bytes_total)` is called as data arrives.
+    """
+    ext = os.path.splitext(s3_key)[1].lower() or ".pdf"
+    path = os.path.join(work_dir(record_id), f"source{ext}")
+    if os.path.exists(path):
+        return path, False
+
+    # Download next to the final path and rename, so a crash never leaves
+    # a truncated file that looks complete
+    s3 = s3_client()
+    callback = None
+    if progress is not None:
+        total = s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key)["ContentLength"]
+        done = 0
+        lock = threading.Lock()  # s3transfer calls back from several threads
+
+        def callback(n_bytes):
+            nonlocal done
+            with lock:
+                done += n_bytes
+                progress(done, total)
+
+    fd, tmp_path = tempfile.mkstemp(dir=work_dir(record_id), suffix=".part")
+    with os.fdopen(fd, "wb") as tmp:
+        s3.download_fileobj(settings.AWS_STORAGE_BUCKET_NAME, s3_key, tmp, Callback=callback)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def write_jsonl(record_id, name, rows):
+    """Stream `rows` into a JSON-lines artifact. Returns the number of rows."""
+    count = 0
+    fd, tmp_path = tempfile.mkstemp(dir=work_dir(record_id), suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+        s3_client().upload_file(
+            tmp_path,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            artifact_key(record_id, name),
+            ExtraArgs={"ContentType": "application/x-ndjson"},
+        )
+    finally:
+        os.remove(tmp_path)
+    return count
+
+
+def iter_jsonl(record_id, name):
+    """Stream rows back from a JSON-lines artifact."""
+    obj = s3_client().get_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=artifact_key(record_id, name),
+    )
+    for line in obj["Body"].iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+def delete_artifacts(record_id):
+    s3 = s3_client()
+    prefix = artifact_key(record_id, "")
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=prefix):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if keys:
+            s3.delete_objects(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Delete={"Objects": keys, "Quiet": True},
+            )
@@ -0,0 +1,245 @@
+"""
+Lexical (BM25) retrieval over ingested chunks, and hybrid retrieval.
+
+The ingestion upsert stage adds each chunk's text, token count and term
+frequencies (ChunkTerm postings) to the database once its vectors are
+stored. Postings go away with their DocumentChunk rows, i.e. when a record
+is deleted or replaced. Only the staged workflow indexes chunks: the legacy
+`utils_process.process_file_from_s3` path creates no UploadRecord or
+DocumentChunk rows, so what it ingests is found by vector search only.
+
+`hybrid_search` runs the vector query on a worker thread while BM25 runs
+on the request thread, then fuses both rankings with reciprocal-rank
+fusion. Exact terms that embeddings handle poorly (remedy names, product
+codes, scripture references) are found by BM25; paraphrases by the
+vectors.
+"""
+
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.db.models.functions import Lower, Trim
+
+from .models import ChunkTerm, DocumentChunk
+from .pinecone_utils import category_tag, query_index
+
+_STATS_KEY = "bm25:stats"
+_STATS_TTL = 300
+_MAX_TERM_LENGTH = 64
+
+# Compound tokens keep their joiners: "b-12", "3:16", "v2.1"
+_TOKEN_RE = re.compile(r"\w+(?:[-:./]\w+)*")
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can did do does for from had has have how i if in into is it
+its me my no not of on or our so than that the their them then there these they this to was we
+were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens without stopwords. A compound token is kept
+    along with its parts, so "John 3:16" matches "3:16" as well as "16".
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        parts = re.split(r"[-:./]", token)
+        if len(parts) > 1:
+            tokens.append(token[:_MAX_TERM_LENGTH])
+        tokens.extend(p[:_MAX_TERM_LENGTH] for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+
+# ---------- Indexing ----------
+
+def index_chunks(record_id, chunks):
+    """
+    Add chunks ({"id": vector_id, "text"}) of a record to the lexical index.
+    Idempotent: a chunk's postings are replaced, not duplicated.
+    """
+    texts = {c["id"]: c["text"] for c in chunks}
+    rows = list(DocumentChunk.objects.filter(record_id=record_id, vector_id__in=list(texts)))
+    postings = []
+    for row in rows:
+        counts = Counter(tokenize(texts[row.vector_id]))
+        row.text = texts[row.vector_id]
+        row.length = sum(counts.values())
+        postings.extend(ChunkTerm(chunk=row, term=term, tf=n) for term, n in counts.items())
+
+    with transaction.atomic():
+        ChunkTerm.objects.filter(chunk__in=rows).delete()
+        DocumentChunk.objects.bulk_update(rows, ["text", "length"], batch_size=500)
+        ChunkTerm.objects.bulk_create(postings, batch_size=2000)
+    invalidate_corpus_stats()
+    return len(rows)
+
+
+def invalidate_corpus_stats():
+    """Make every process recompute the corpus stats after chunks were added or removed."""
+    try:
+        caches["shared"].delete(_STATS_KEY)
+    except Exception as e:
+        print(" Shared cache unavailable; BM25 stats refresh within their TTL:", e)
+
+
+def _corpus_stats():
+    """
+    (number of indexed chunks, average chunk length), cached in the shared
+    cache so that ingestion in a worker invalidates it for the web processes.
+    """
+    try:
+        stats = caches["shared"].get(_STATS_KEY)
+    except Exception as e:
+        print(" Shared cache unavailable:", e)
+        stats = None
+    if stats is None:
+        agg = DocumentChunk.objects.filter(length__gt=0).aggregate(n=Count("id"), avgdl=Avg("length"))
+        stats = (agg["n"], agg["avgdl"] or 0.0)
+        try:
+            caches["shared"].set(_STATS_KEY, stats, _STATS_TTL)
+        except Exception:
+            pass
+    return stats
+
+
+# ---------- Search ----------
+
+def lexical_search(query, top_k=20, category=None):
+    """
+    BM25 top-k chunks for `query`, optionally within one category, as
+    [{"id", "score", "metadata"}] like query_index. Categories compare like
+    the vector metadata does (see category_tag). Terms that occur in more
+    than BM25_MAX_DF_RATIO of all chunks are ignored.
+    """
+    started = time.perf_counter()
+    terms = set(tokenize(query))
+    n_docs, avgdl = _corpus_stats()
+    if not terms or not n_docs:
+        return []
+
+    df = dict(
+        ChunkTerm.objects.filter(term__in=terms)
+        .values("term").annotate(n=Count("id")).values_list("term", "n")
+    )
+    max_df = max(1, int(n_docs * settings.BM25_MAX_DF_RATIO))
+    idf = {
+        t: math.log(1 + (n_docs - n + 0.5) / (n + 0.5))
+        for t, n in df.items() if n <= max_df
+    }
+    if not idf:
+        return []
+
+    postings = ChunkTerm.objects.filter(term__in=list(idf))
+    category = category_tag(category)
+    if category:
+        postings = postings.alias(
+            category_tag=Lower(Trim("chunk__record__category"))
+        ).filter(category_tag=category)
+
+    k1, b = settings.BM25_K1, settings.BM25_B
+    scores = {}
+    for chunk_id, term, tf, length in postings.values_list("chunk_id", "term", "tf", "chunk__length"):
+        norm = k1 * (1 - b + b * length / avgdl)
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[term] * tf * (k1 + 1) / (tf + norm)
+
+    # A vector shared by two versions of a document has a chunk row in each
+    best = heapq.nlargest(top_k * 2, scores.items(), key=lambda kv: kv[1])
+    rows = DocumentChunk.objects.filter(id__in=[chunk_id for chunk_id, _ in best]).values(
+        "id", "vector_id", "text", "page", "record_id", "record__category"
+    )
+    rows = {r["id"]: r for r in rows}
+
+    matches, seen = [], set()
+    for chunk_id, score in best:
+        row = rows.get(chunk_id)
+        if row is None or row["vector_id"] in seen:
+            continue
+        seen.add(row["vector_id"])
+        metadata = {"text": row["text"], "record_id": row["record_id"]}
+        if row["page"] is not None:
+            metadata["page"] = row["page"]
+        tag = category_tag(row["record__category"])
+        if tag:
+            metadata["category"] = tag
+        matches.append({"id": row["vector_id"], "score": score, "metadata": metadata})
+        if len(matches) == top_k:
+            break
+
+    print(f"🔤 BM25 query: {len(idf)} terms, {len(scores)} candidates, {len(matches)} matches "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return matches
+
+
+# ---------- Hybrid ----------
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """
+    Merge ranked match lists: each match scores sum(1 / (k + rank)) over
+    the lists it appears in. Returns matches best first, with that score.
+    """
+    fused, first_seen = {}, {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            fused[match["id"]] = fused.get(match["id"], 0.0) + 1 / (k + rank)
+            first_seen.setdefault(match["id"], match)
+    order = sorted(fused, key=fused.get, reverse=True)
+    return [dict(first_seen[vid], score=fused[vid]) for vid in order]
+
+
+_vector_pool = None
+_vector_pool_lock = threading.Lock()
+
+
+def _pool():
+    global _vector_pool
+    with _vector_pool_lock:
+        if _vector_pool is None:
+            _vector_pool = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_VECTOR_THREADS,
+                                              thread_name_prefix="vector-query")
+        return _vector_pool
+
+
+def hybrid_search(query, query_vector, category=None, top_k=None):
+    """
+    Top chunks for a question by vector and BM25 search fused with RRF.
+    Each retriever contributes RETRIEVAL_CANDIDATES candidates. If one
+    retriever fails, the other's ranking is used alone.
+    """
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    candidates = max(top_k, settings.RETRIEVAL_CANDIDATES)
+    category = category_tag(category)
+    search_filter = {"category": category} if category else None
+
+    # The vector query needs no database access, so it can run off-thread
+    vector_future = _pool().submit(query_index, query_vector, top_k=candidates, filter=search_filter)
+    lexical_error = vector_error = None
+    try:
+        lexical = lexical_search(query, top_k=candidates, category=category)
+    except Exception as e:
+        lexical, lexical_error = [], e
+    try:
+        vector = vector_future.result()
+    except Exception as e:
+        vector, vector_error = [], e
+
+    # Either retriever alone is still a usable ranking; fail only if both do
+    if lexical_error and vector_error:
+        raise vector_error
+    if lexical_error:
+        print(" BM25 search failed; using vector results only:", lexical_error)
+    if vector_error:
+        print(" Vector search failed; using BM25 results only:", vector_error)
+
+    return reciprocal_rank_fusion(vector, lexical, k=settings.RRF_K)[:top_k]
@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from celery import current_app
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from chatbot.benchmark import FakeOpenAI, FakeS3, PeakRSS, build_corpus, local_services
+from chatbot.vectorstores import LocalStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark document ingestion end to end against local fakes of S3, "
+        "OpenAI and ElevenLabs and a local vector store, in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pipeline", choices=["staged", "legacy", "both"], default="staged",
+                            help="staged: process_s3_file_task; legacy: process_file_from_s3")
+        parser.add_argument("--embed-latency-ms", type=int, default=150,
+                            help="Simulated latency of one embeddings request")
+        parser.add_argument("--text-pages", type=int, default=40)
+        parser.add_argument("--pdf-pages", type=int, default=40)
+        parser.add_argument("--scanned-pages", type=int, default=6,
+                            help="Pages of the image-only PDF (0 to skip OCR)")
+        parser.add_argument("--files", nargs="*", default=[],
+                            help="Benchmark these files instead of the generated corpus")
+
+    def handle(self, *args, **options):
+        work = tempfile.mkdtemp(prefix="ingest-bench-")
+        conf = current_app.conf
+        eager = (conf.task_always_eager, conf.task_eager_propagates)
+        old_db = connection.settings_dict["NAME"]
+
+        conf.task_always_eager = True
+        conf.task_eager_propagates = True
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(INGEST_WORK_DIR=os.path.join(work, "ingest")):
+                self._run(work, options)
+        finally:
+            connection.creation.destroy_test_db(old_db, verbosity=0)
+            conf.task_always_eager, conf.task_eager_propagates = eager
+            shutil.rmtree(work, ignore_errors=True)
+
+    def _run(self, work, options):
+        if options["files"]:
+            corpus = [(os.path.splitext(p)[1].lstrip(".") or "file", p, None) for p in options["files"]]
+        else:
+            self.stdout.write("Generating corpus...")
+            corpus = build_corpus(work, options["text_pages"], options["pdf_pages"], options["scanned_pages"])
+
+        pipelines = ["staged", "legacy"] if options["pipeline"] == "both" else [options["pipeline"]]
+        s3 = FakeS3()
+        store = LocalStore(os.path.join(work, "vectors"), dtype=settings.VECTOR_STORE_DTYPE)
+        openai = FakeOpenAI(options["embed_latency_ms"], settings.EMBEDDING_DIMENSIONS or 1536)
+
+        results = []
+        with local_services(s3, openai, store):
+            for pipeline in pipelines:
+                for kind, path, pages in corpus:
+                    key = f"uploads/bench-{uuid.uuid4()}_{os.path.basename(path)}"
+                    with open(path, "rb") as f:
+                        s3.put_object(settings.AWS_STORAGE_BUCKET_NAME, key, f.read())
+                    requests_before = openai.requests
+                    run = self._staged if pipeline == "staged" else self._legacy
+                    result = run(path, key, pages)
+                    result.update(pipeline=pipeline, kind=kind, requests=openai.requests - requests_before)
+                    results.append(result)
+                    self._report(result)
+
+        self._summary(results)
+
+    def _staged(self, path, key, pages):
+        from chatbot.models import UploadRecord
+        from chatbot.tasks import process_s3_file_task
+
+        record = UploadRecord.objects.create(
+            role="admin", original_name=os.path.basename(path), s3_key=key, status="uploaded"
+        )
+        error = None
+        with PeakRSS() as mem:
+            started = time.perf_counter()
+            try:
+                process_s3_file_task(record.id, key)
+            except Exception as e:
+                error = str(e)
+            seconds = time.perf_counter() - started
+
+        record.refresh_from_db()
+        return {
+            "file": os.path.basename(path),
+            "pages": record.pages_total or record.pages_done or pages or 0,
+            "chunks": record.chunks_total,
+            "seconds": seconds,
+            "peak_rss": mem.peak,
+            "stages": record.stage_timings,
+            "error": error or record.error,
+        }
+
+    def _legacy(self, path, key, pages):
+        from chatbot.utils_process import process_file_from_s3
+
+        error, chunks = None, 0
+        with PeakRSS() as mem:
+            started = time.perf_counter()
+            try:
+                chunks = process_file_from_s3(key).get("chunks", 0)
+            except Exception as e:
+                error = str(e)
+            seconds = time.perf_counter() - started
+
+        return {
+            "file": os.path.basename(path),
+            "pages": pages or 0,
+            "chunks": chunks,
+            "seconds": seconds,
+            "peak_rss": mem.peak,
+            "stages": {},
+            "error": error,
+        }
+
+    def _report(self, r):
+        line = (
+            f"[{r['pipeline']}] {r['kind']:<12} {r['file']:<16} "
+            f"{r['pages']:>5} pages {r['chunks']:>6} chunks {r['seconds']:>8.2f}s  "
+            f"{r['pages'] / r['seconds']:>7.1f} pages/s {r['chunks'] / r['seconds']:>8.1f} chunks/s  "
+            f"peak RSS {r['peak_rss'] / 2**20:>6.0f} MB  {r['requests']} embed requests"
+        )
+        if r["error"]:
+            self.stdout.write(self.style.ERROR(f"{line}\n    FAILED: {r['error']}"))
+            return
+        self.stdout.write(line)
+        if r["stages"]:
+            stages = ", ".join(f"{name} {secs:.2f}s" for name, secs in r["stages"].items())
+            self.stdout.write(f"    stages: {stages}")
+
+    def _summary(self, results):
+        for pipeline in sorted({r["pipeline"] for r in results}):
+            rows = [r for r in results if r["pipeline"] == pipeline and not r["error"]]
+            if not rows:
+                continue
+            seconds = sum(r["seconds"] for r in rows)
+            pages = sum(r["pages"] for r in rows)
+            chunks = sum(r["chunks"] for r in rows)
+            self.stdout.write(self.style.SUCCESS(
+                f"[{pipeline}] total: {pages} pages, {chunks} chunks in {seconds:.2f}s — "
+                f"{pages / seconds:.1f} pages/s, {chunks / seconds:.1f} chunks/s, "
+                f"peak RSS {max(r['peak_rss'] for r in rows) / 2**20:.0f} MB"
+            ))
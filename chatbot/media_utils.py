@@ -0,0 +1,183 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .clients import get_openai
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".aac", ".ogg", ".flac", ".webm")
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov")
+MEDIA_EXTENSIONS = AUDIO_EXTENSIONS + VIDEO_EXTENSIONS
+
+# Whisper API upload limit, with headroom
+MAX_SEGMENT_BYTES = 24 * 1024 * 1024
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_SILENCE_START_RE = re.compile(r"silence_start: (-?\d+(?:\.\d+)?)")
+_SILENCE_END_RE = re.compile(r"silence_end: (\d+(?:\.\d+)?)")
+
+
+def ffmpeg_exe():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def is_media(path):
+    return path.lower().endswith(MEDIA_EXTENSIONS)
+
+
+def detect_silences(path):
+    """
+    Decode the audio track once with ffmpeg's silencedetect filter.
+    Returns (duration_seconds, [silence midpoints in seconds]); the
+    duration is 0.0 if the container does not report one.
+    """
+    cmd = [
+        ffmpeg_exe(), "-hide_banner", "-nostats", "-i", path, "-vn",
+        "-af", f"silencedetect=noise={settings.MEDIA_SILENCE_DB}dB:d={settings.MEDIA_SILENCE_SECONDS}",
+        "-f", "null", "-",
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    out = proc.stderr
+    if proc.returncode != 0:
+        tail = out.strip().splitlines()[-1:] or ["no output"]
+        raise RuntimeError(f"ffmpeg could not decode the audio of {os.path.basename(path)}: {tail[0]}")
+
+    duration = 0.0
+    m = _DURATION_RE.search(out)
+    if m:
+        h, mnt, sec = m.groups()
+        duration = int(h) * 3600 + int(mnt) * 60 + float(sec)
+
+    midpoints = []
+    start = None
+    for line in out.splitlines():
+        m = _SILENCE_START_RE.search(line)
+        if m:
+            start = max(0.0, float(m.group(1)))
+            continue
+        m = _SILENCE_END_RE.search(line)
+        if m and start is not None:
+            midpoints.append((start + float(m.group(1))) / 2)
+            start = None
+    return duration, midpoints
+
+
+def plan_split_points(duration, silences, target, max_len):
+    """
+    Choose cut points roughly every `target` seconds, snapped to the
+    silence closest to the ideal cut; hard-cut at `max_len` if no silence
+    is found in range.
+    """
+    points = []
+    last = 0.0
+    while duration - last > max_len:
+        ideal = last + target
+        candidates = [s for s in silences if last + target / 2 < s <= last + max_len]
+        cut = min(candidates, key=lambda s: abs(s - ideal)) if candidates else last + target
+        points.append(round(cut, 3))
+        last = cut
+    return points
+
+
+def split_audio(path, out_dir):
+    """
+    Stream the audio track through ffmpeg into mono, low-bitrate MP3
+    segments split on silence. Returns [(segment_path, start_seconds)].
+    """
+    target = settings.MEDIA_SEGMENT_SECONDS
+    max_len = settings.MEDIA_SEGMENT_MAX_SECONDS
+    bitrate = settings.MEDIA_BITRATE_KBPS
+    # Every segment must stay under the upload limit
+    max_len = min(max_len, MAX_SEGMENT_BYTES * 8 / (bitrate * 1000))
+    target = min(target, max_len)
+
+    duration, silences = detect_silences(path)
+    cmd = [
+        ffmpeg_exe(), "-hide_banner", "-nostats", "-loglevel", "error",
+        "-i", path, "-vn", "-ac", "1", "-ar", "16000",
+        "-c:a", "libmp3lame", "-b:a", f"{bitrate}k",
+        "-f", "segment", "-reset_timestamps", "1",
+    ]
+    if duration > 0:
+        points = plan_split_points(duration, silences, target, max_len)
+        print(f"🎧 Media duration {duration:.0f}s, {len(silences)} silences, "
+              f"{len(points) + 1} segments")
+        if points:
+            cmd += ["-segment_times", ",".join(str(p) for p in points)]
+    else:
+        # Unknown length (e.g. a streamed recording): cut every `target` seconds
+        points = None
+        print(f"⚠️ Media duration unknown; splitting every {target:.0f}s")
+        cmd += ["-segment_time", str(target)]
+    cmd.append(os.path.join(out_dir, "seg%05d.mp3"))
+    subprocess.run(cmd, check=True, capture_output=True)
+
+    files = sorted(f for f in os.listdir(out_dir) if f.startswith("seg"))
+    if points is None:
+        starts = [i * target for i in range(len(files))]
+    else:
+        starts = [0.0] + points
+    return [(os.path.join(out_dir, f), starts[i]) for i, f in enumerate(files)]
+
+
+def _timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _transcribe_segment(seg_path, offset):
+    started = time.perf_counter()
+    with open(seg_path, "rb") as f:
+        res = get_openai().audio.transcriptions.create(
+            model="whisper-1", file=f, response_format="verbose_json"
+        )
+    elapsed = time.perf_counter() - started
+
+    lines = [
+        f"[{_timestamp(offset + seg.start)}] {seg.text.strip()}"
+        for seg in (res.segments or [])
+        if seg.text.strip()
+    ]
+    if not lines and res.text.strip():
+        lines = [f"[{_timestamp(offset)}] {res.text.strip()}"]
+    print(f"➡️ Transcribed segment at {_timestamp(offset)} in {elapsed:.1f}s")
+    return "\n".join(lines)
+
+
+def iter_media_transcript(path):
+    """
+    Transcribe an audio or video file with Whisper.
+
+    The audio is split on silence into segments below the API size limit,
+    segments are transcribed concurrently (MEDIA_TRANSCRIBE_WORKERS), and
+    the transcript is yielded one segment at a time, in order, as lines
+    prefixed with [hh:mm:ss] timestamps relative to the whole file.
+    """
+    out_dir = tempfile.mkdtemp(prefix="media-")
+    try:
+        segments = split_audio(path, out_dir)
+        workers = max(1, min(settings.MEDIA_TRANSCRIBE_WORKERS, len(segments)))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_transcribe_segment, p, start) for p, start in segments]
+            for future in futures:
+                text = future.result()
+                if text:
+                    yield text + "\n"
+        print(f"📌 Transcribed {len(segments)} segments on {workers} workers "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def transcribe_media(path):
+    return "".join(iter_media_transcript(path))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0013_embeddingcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='page_sources',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0016_uploadrecord_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='chunk_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0017_uploadrecord_chunk_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='upload_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
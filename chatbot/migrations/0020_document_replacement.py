@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0019_uploadrecord_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='replaces',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replaced_by', to='chatbot.uploadrecord'),
+        ),
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='lineage_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='kb_doc_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_hash', models.CharField(max_length=64)),
+                ('vector_id', models.CharField(db_index=True, max_length=100)),
+                ('page', models.IntegerField(blank=True, null=True)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='chatbot.uploadrecord')),
+            ],
+            options={
+                'unique_together': {('record', 'vector_id')},
+            },
+        ),
+    ]
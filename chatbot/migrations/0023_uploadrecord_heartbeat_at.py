@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0022_lexical_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadrecord',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -18,10 +18,49 @@ class UploadRecord(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="user")
     original_name = models.CharField(max_length=255)
     s3_key = models.CharField(max_length=500, blank=True, null=True)
+    # S3 multipart upload id while the client uploads directly to S3
+    upload_id = models.CharField(max_length=255, blank=True, null=True)
+    # Who started a direct upload; only they may complete or abort it
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="uploads"
+    )
+    # sha256 of the file content; uploads of identical content are not reprocessed
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="duplicates"
+    )
+    # Previous version of the same document; its vectors are diffed and retired
+    replaces = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="replaced_by"
+    )
+    # Id of the first version of the document; prefixes the vector IDs so
+    # unchanged chunks keep their vectors across versions
+    lineage_id = models.BigIntegerField(null=True, blank=True)
+    # ElevenLabs knowledge-base document created for this upload
+    kb_doc_id = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=50, default="pending") 
     error = models.TextField(blank=True, null=True)
     category = models.CharField(max_length=100, null=True, blank=True)
+    # PDF pages by extraction path: {"text": [1, 2, ...], "ocr": [3, ...]}
+    page_sources = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Heartbeat of the ingestion workflow, bumped by every stage as it makes
+    # progress; started records without one for a while are resumed
+    heartbeat_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    resume_count = models.PositiveIntegerField(default=0)
+    # Structured ingestion progress
+    stage = models.CharField(max_length=30, blank=True, default="")
+    bytes_downloaded = models.BigIntegerField(default=0)
+    bytes_total = models.BigIntegerField(default=0)
+    pages_done = models.PositiveIntegerField(default=0)
+    pages_total = models.PositiveIntegerField(default=0)
+    chunks_embedded = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    # Token statistics of the chunker output (see chunking.ChunkStats)
+    chunk_stats = models.JSONField(default=dict, blank=True)
+    # Seconds spent per stage: download, extract, ocr, chunk, embed, upsert, kb_sync
+    stage_timings = models.JSONField(default=dict, blank=True)
 
 
     def __str__(self):
@@ -29,6 +68,57 @@ class UploadRecord(models.Model):
 
 
 
+class DocumentChunk(models.Model):
+    """A chunk of an ingested upload and the Pinecone vector that holds it."""
+    record = models.ForeignKey(UploadRecord, on_delete=models.CASCADE, related_name="chunks")
+    chunk_hash = models.CharField(max_length=64)
+    vector_id = models.CharField(max_length=100, db_index=True)
+    page = models.IntegerField(null=True, blank=True)
+    # Filled in when the chunk is added to the lexical index
+    text = models.TextField(blank=True, default="")
+    length = models.PositiveIntegerField(default=0)  # tokens, for BM25
+
+    class Meta:
+        unique_together = ("record", "vector_id")
+
+    def __str__(self):
+        return f"{self.record_id} - {self.vector_id}"
+
+
+class ChunkTerm(models.Model):
+    """BM25 posting: how often `term` occurs in a chunk (see lexical)."""
+    chunk = models.ForeignKey(DocumentChunk, on_delete=models.CASCADE, related_name="terms")
+    term = models.CharField(max_length=64)
+    tf = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("chunk", "term")
+        indexes = [models.Index(fields=["term"], name="chunk_term_idx")]
+
+    def __str__(self):
+        return f"{self.term} x{self.tf} - {self.chunk_id}"
+
+
+
+class IngestionCheckpoint(models.Model):
+    """
+    One finished unit of ingestion work (a stage, or one part/shard of it).
+    A re-run of the workflow skips every unit that already has a row here.
+    """
+    record = models.ForeignKey(UploadRecord, on_delete=models.CASCADE, related_name="checkpoints")
+    stage = models.CharField(max_length=30)
+    part = models.IntegerField(default=0)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("record", "stage", "part")
+
+    def __str__(self):
+        return f"{self.record_id} - {self.stage}[{self.part}]"
+
+
+
 
 class ChatSession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -57,4 +147,45 @@ from django.db import models
 
 class ProcessedStripeEvent(models.Model):
     stripe_event_id = models.CharField(max_length=255, unique=True)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class EmbeddingCache(models.Model):
+    """
+    Content-addressed store of embedding vectors, keyed by
+    (model, dimensions, sha256 of the normalized text).
+    """
+    model = models.CharField(max_length=100)
+    dimensions = models.PositiveIntegerField(default=0)  # 0 = model default
+    text_hash = models.CharField(max_length=64)
+    vector = models.BinaryField()  # float32 bytes
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("model", "dimensions", "text_hash")
+
+    def __str__(self):
+        return f"{self.model}/{self.dimensions} - {self.text_hash[:12]}"
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    A generated answer, reusable for a semantically similar question that
+    retrieves the same context (see answer_cache).
+    """
+    category = models.CharField(max_length=100, blank=True, default="")  # "" = unfiltered query
+    context_fingerprint = models.CharField(max_length=64)
+    query_vector = models.BinaryField()  # float32 bytes, unit length
+    question = models.TextField()
+    answer = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["category", "context_fingerprint"], name="answer_cache_lookup_idx")]
+
+    def __str__(self):
+        return f"{self.category or '*'} - {self.question[:40]}"
@@ -1,24 +1,210 @@
+"""
+Vector index access.
+
+Storing, querying and maintaining vectors goes through the VECTOR_BACKEND
+store (see vectorstores): Pinecone, or the local memory-mapped index.
+
+The Pinecone client and index handle come from the per-process registry in
+clients.py: the index host is resolved once per process (or taken from
+PINECONE_INDEX_HOST) and the handle keeps its connections open, so a query
+costs one round trip. Set PINECONE_GRPC to use the gRPC transport. The
+async helpers run many queries or upsert batches with bounded
+concurrency.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
-from pinecone import Pinecone
 
+from .clients import get_vector_store
+from .embedding_utils import text_hash
+
+
+def vector_id(record_id, text):
+    """Stable vector ID: the same chunk of the same upload always maps to the same ID."""
+    return f"rec{record_id}-{text_hash(text)[:32]}"
+
+
+def category_tag(category):
+    """Category as stored in vector metadata and matched by query filters."""
+    return category.strip().lower() if category and category.strip() else None
+
+
+def _vector_bytes(vector):
+    """Approximate serialized size of one vector in an upsert request."""
+    return len(json.dumps(vector, separators=(",", ":")))
+
+
+def make_upsert_batches(vectors):
+    """
+    Group vectors into upsert requests, closing a batch when it reaches
+    PINECONE_UPSERT_BATCH_SIZE vectors or PINECONE_UPSERT_MAX_BYTES.
+    Yields (vectors, approx_bytes); consumes `vectors` lazily.
+    """
+    max_count = settings.PINECONE_UPSERT_BATCH_SIZE
+    max_bytes = settings.PINECONE_UPSERT_MAX_BYTES
+
+    batch, batch_bytes = [], 0
+    for vector in vectors:
+        size = _vector_bytes(vector)
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch, batch_bytes
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        yield batch, batch_bytes
+
+
+def _upsert_batch(store, batch_no, batch, n_bytes):
+    """
+    Upsert one batch, skipping vectors that are already stored, with up to
+    PINECONE_UPSERT_RETRIES attempts. Returns (upserted, skipped, seconds).
+    """
+    started = time.perf_counter()
+    attempts = settings.PINECONE_UPSERT_RETRIES
+    for attempt in range(1, attempts + 1):
+        try:
+            present = store.fetch_ids([v["id"] for v in batch])
+            pending = [v for v in batch if v["id"] not in present]
+            if pending:
+                store.upsert(pending)
+            break
+        except Exception as e:
+            if attempt == attempts:
+                print(f"❌ Upsert batch {batch_no} failed after {attempts} attempts:", e)
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Upsert batch {batch_no} attempt {attempt} failed ({e}); retrying in {delay}s")
+            time.sleep(delay)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"🌲 Upsert batch {batch_no}: {len(pending)} upserted, {len(present)} present, "
+        f"{n_bytes / 1024:.0f} KB in {elapsed * 1000:.0f} ms"
+    )
+    return len(pending), len(present), elapsed
+
+
+def store_into_pinecone(embeddings, record_id, category=None):
+    """
+    Idempotently upsert chunk embeddings for one UploadRecord.
 
-def store_into_pinecone(embeddings):
-    if len(embeddings) == 0:
+    Vector IDs are derived from the record and the chunk content hash, so a
+    retried or re-run task only upserts vectors that are missing or whose
+    content changed; the rest are skipped.
+
+    Vectors are built lazily from `embeddings` (any iterable), split into
+    batches by count and request size, and sent by up to
+    PINECONE_UPSERT_WORKERS threads; each batch is retried on its own.
+    Vectors are tagged with `record_id` and, if set, `category`.
+    """
+    store = get_vector_store()
+    workers = settings.PINECONE_UPSERT_WORKERS
+    category = category_tag(category)
+
+    def vectors():
+        seen = set()
+        for item in embeddings:
+            vid = item.get("id") or vector_id(record_id, item["text"])
+            if vid in seen:
+                continue
+            seen.add(vid)
+            metadata = {"text": item["text"], "record_id": record_id}
+            if item.get("page") is not None:
+                metadata["page"] = item["page"]
+            if category:
+                metadata["category"] = category
+            yield {"id": vid, "values": item["embedding"], "metadata": metadata}
+
+    started = time.perf_counter()
+    upserted = skipped = batches = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch, n_bytes in make_upsert_batches(vectors()):
+            batches += 1
+            # Keep at most `workers` batches in memory at a time
+            if len(pending) >= workers:
+                done, present, _ = pending.popleft().result()
+                upserted += done
+                skipped += present
+            pending.append(pool.submit(_upsert_batch, store, batches, batch, n_bytes))
+        for future in pending:
+            done, present, _ = future.result()
+            upserted += done
+            skipped += present
+
+    if not batches:
         print("⚠️ No embeddings to store. Skipping Pinecone upload.")
-        return
+        return {"upserted": 0, "skipped": 0, "batches": 0}
+
+    wall = time.perf_counter() - started
+    print(
+        f"🌲 Upserted {upserted} vectors ({skipped} already present) in {batches} batches "
+        f"on {workers} workers in {wall:.2f}s — {(upserted + skipped) / wall:.0f} vectors/s"
+    )
+    return {"upserted": upserted, "skipped": skipped, "batches": batches}
+
+
+def list_vector_ids(prefix):
+    """All vector IDs starting with `prefix` (serverless indexes only on Pinecone)."""
+    return get_vector_store().list_ids(prefix)
+
+
+def delete_vectors(ids):
+    """Delete vectors by ID. Returns the number of IDs sent."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    store = get_vector_store()
+    store.delete(ids)
+    print(f"🗑️ Deleted {len(ids)} vectors from {store.name}")
+    return len(ids)
+
+
+def update_vector_metadata(ids, metadata):
+    """Set `metadata` fields on many vectors."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    started = time.perf_counter()
+    get_vector_store().update_metadata(ids, metadata)
+    print(f"🌲 Updated metadata of {len(ids)} vectors in {time.perf_counter() - started:.2f}s")
+    return len(ids)
+
+
+# ---------- Query ----------
+
+def query_index(vector, top_k=3, filter=None):
+    """Nearest vectors to `vector`, as [{"id", "score", "metadata"}]."""
+    started = time.perf_counter()
+    store = get_vector_store()
+    matches = store.query(vector, top_k=top_k, filter=filter)
+    print(f"🔎 {store.name} query: {len(matches)} matches in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return matches
+
+
+# ---------- Async ----------
+
+async def aquery_many(queries, concurrency=None):
+    """
+    Run many queries concurrently. `queries` are query keyword dicts, e.g.
+    {"vector": ..., "top_k": 3}. Returns the matches of each query, in order.
+    """
+    store = get_vector_store()
+    return await store.aquery_many(queries, concurrency or settings.PINECONE_QUERY_CONCURRENCY)
 
-    print("🌲 Upserting vectors into Pinecone...")
 
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-    index = pc.Index(settings.PINECONE_INDEX_NAME)
+async def aupsert_batches(batches, concurrency=None):
+    """Upsert pre-built vector batches concurrently. Returns the number of vectors sent."""
+    store = get_vector_store()
+    return await store.aupsert_batches(batches, concurrency or settings.PINECONE_UPSERT_WORKERS)
 
-    vectors = []
-    for i, item in enumerate(embeddings):
-        vectors.append({
-            "id": f"vec-{i}",
-            "values": item["embedding"],
-            "metadata": {"text": item["text"]}
-        })
 
-    index.upsert(vectors)
+def query_many(queries, concurrency=None):
+    """Synchronous wrapper around aquery_many."""
+    return asyncio.run(aquery_many(queries, concurrency))
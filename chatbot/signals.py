@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import UploadRecord
+
+
+@receiver(pre_delete, sender=UploadRecord)
+def purge_deleted_record(sender, instance, **kwargs):
+    """
+    Collect the vectors a record owns while its DocumentChunk rows still
+    exist, and remove them from Pinecone (plus its KB document and ingestion
+    artifacts) once the delete is committed. Vectors that another version
+    of the document still uses are kept.
+    """
+    if instance.status == "awaiting_upload":
+        return  # aborted direct upload; nothing was ingested
+
+    from .tasks import purge_record_vectors, record_vector_ids, unshared_vector_ids
+
+    vector_ids = sorted(unshared_vector_ids(instance, record_vector_ids(instance)))
+    record_id, kb_doc_id, category = instance.id, instance.kb_doc_id, instance.category
+    transaction.on_commit(
+        lambda: purge_record_vectors.delay(record_id, vector_ids, kb_doc_id, category)
+    )
@@ -1,114 +1,707 @@
-import os
-import tempfile
-import boto3
-from celery import shared_task
+"""
+Ingestion workflow
+==================
+
+    download → extract → chunk → chord(embed shard × N) → upsert → KB sync
+
+The KB sync stage only queues the record: `sync_knowledge_base` picks up
+every queued record after a short debounce window, creates their
+ElevenLabs KB documents concurrently and applies one agent update for all
+of them under a Redis lock.
+
+Each stage is its own task with its own retry policy and queue (see
+CELERY_TASK_ROUTES), and hands its output to the next stage through S3
+artifacts (see ingest_artifacts). A failing stage is retried on its own;
+e.g. a transient Pinecone error only re-runs the upsert, never the OCR.
+Embedding shards write to the shared embedding cache, so the upsert stage
+reads vectors back from the cache instead of passing them through the
+result backend.
+
+The download stage also checks the file's sha256: a record whose content
+matches an earlier upload is linked to it (`duplicate_of`), marked
+"duplicate", and the workflow stops there.
+
+A record that `replaces` an earlier version shares that version's vector
+ID prefix (`lineage_id`), so unchanged chunks keep their vectors: they are
+neither re-embedded nor re-upserted. Once the new version is live,
+`retire_replaced_record` deletes the vectors of removed chunks, and the KB
+sync swaps the old KB document for the new one. Deleting an UploadRecord
+cleans up the same way (see signals).
+
+The upsert stage also adds each shard's chunks to the BM25 index (see
+lexical). Upserting, retiring, re-categorizing or purging a record drops
+the cached answers of its category (see answer_cache).
+
+Every finished unit of work (extracted page part, chunk manifest, embedded
+shard, upserted shard, KB sync) is recorded as an IngestionCheckpoint, and
+every stage skips the units that are already checkpointed. Re-running
+`process_s3_file_task`, by hand or from the `resume_stale_ingestions`
+sweeper, therefore resumes from the last checkpoint.
+"""
+
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from celery import Task, chain, chord, shared_task
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DocumentChunk, IngestionCheckpoint, UploadRecord
+from .chunking import TokenChunker
+from .extract_utils import iter_pages
+from .pinecone_utils import (
+    category_tag,
+    delete_vectors,
+    list_vector_ids,
+    store_into_pinecone,
+    update_vector_metadata,
+    vector_id,
+)
+from .clients import get_redis
+from .answer_cache import invalidate_answers
+from .lexical import index_chunks, invalidate_corpus_stats
+from .elevenlabs_utils import create_kb_doc, delete_kb_docs, update_agent_knowledge_base
+from .embedding_utils import embed_texts, evict_cache, text_hash
+from .utils_upload import find_duplicate
+from .ingest_artifacts import (
+    clear_work_dir,
+    delete_artifacts,
+    iter_jsonl,
+    local_source,
+    write_jsonl,
+)
+
+
+class IngestTask(Task):
+    """Marks the UploadRecord failed once a stage has exhausted its retries."""
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        record_id = args[0] if args else kwargs.get("record_id")
+        print(f" ERROR in {self.name} for record {record_id}:", str(exc))
+        UploadRecord.objects.filter(id=record_id).update(status="failed", error=str(exc))
+
+
+def _stage(**options):
+    """shared_task preset for ingestion stages: retry any error with backoff."""
+    return shared_task(
+        bind=True,
+        base=IngestTask,
+        autoretry_for=(Exception,),
+        retry_backoff=True,
+        retry_jitter=True,
+        acks_late=True,
+        **options,
+    )
+
+
+def _shard_name(shard_no):
+    return f"chunks/{shard_no:05d}.jsonl"
+
+
+def _pages_part_name(part_no):
+    return f"pages/{part_no:05d}.jsonl"
+
+
+def _touch(record_id, **fields):
+    """Update the record and its heartbeat (queryset.update skips auto_now)."""
+    now = timezone.now()
+    UploadRecord.objects.filter(id=record_id).update(updated_at=now, heartbeat_at=now, **fields)
+
+
+# checkpoint stage -> reported stage in UploadRecord.stage_timings
+TIMED_STAGES = {
+    "download": "download",
+    "extract_part": "extract",
+    "chunk": "chunk",
+    "embed": "embed",
+    "upsert": "upsert",
+    "kb_sync": "kb_sync",
+}
+
+
+def _stage_timings(record_id):
+    """Seconds spent per stage, summed over all checkpointed units of work."""
+    timings = {}
+    rows = IngestionCheckpoint.objects.filter(
+        record_id=record_id, stage__in=TIMED_STAGES
+    ).values_list("stage", "data")
+    for stage, data in rows:
+        name = TIMED_STAGES[stage]
+        timings[name] = round(timings.get(name, 0) + data.get("seconds", 0), 3)
+        if "ocr_seconds" in data:
+            timings["ocr"] = round(timings.get("ocr", 0) + data["ocr_seconds"], 3)
+    return timings
 
-from openai import OpenAI
-from pinecone import Pinecone
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-from .models import UploadRecord
-from .extract_utils import extract_text_from_file     
-from .pinecone_utils import store_into_pinecone        
-from .elevenlabs_utils import update_elevenlabs_agent  
+def _checkpoint(record_id, stage, part=0, **data):
+    """
+    Record a finished unit of work. Timings are recomputed from the
+    checkpoints rather than incremented, so parallel shards cannot lose
+    each other's updates. Returns True if the unit was not checkpointed
+    before.
+    """
+    _, created = IngestionCheckpoint.objects.update_or_create(
+        record_id=record_id, stage=stage, part=part, defaults={"data": data}
+    )
+    _touch(record_id, stage_timings=_stage_timings(record_id))
+    return created
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+def _checkpointed(record_id, stage, part=0):
+    """Checkpoint data of a finished unit, or None if it has not finished."""
+    row = IngestionCheckpoint.objects.filter(record_id=record_id, stage=stage, part=part).first()
+    return row.data if row else None
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_vector_ids(record):
+    """Vector IDs stored for a record, from its DocumentChunk rows."""
+    ids = set(record.chunks.values_list("vector_id", flat=True))
+    if not ids and record.status == "completed" and record.lineage_id in (None, record.id):
+        # Ingested before chunks were tracked; its IDs carry its own prefix
+        try:
+            ids = set(list_vector_ids(f"rec{record.id}-"))
+        except Exception as e:
+            print(f" Cannot list vectors of record {record.id}:", e)
+    return ids
+
+
+def unshared_vector_ids(record, ids):
+    """The subset of `ids` that no other record's chunks still point at."""
+    shared = set(
+        DocumentChunk.objects
+        .filter(vector_id__in=list(ids))
+        .exclude(record_id=record.id)
+        .values_list("vector_id", flat=True)
+    )
+    return set(ids) - shared
+
+
+def _lineage_id(record):
+    if record.lineage_id is None:
+        previous = record.replaces
+        record.lineage_id = (previous.lineage_id or previous.id) if previous else record.id
+        _touch(record.id, lineage_id=record.lineage_id)
+    return record.lineage_id
+
+
+def _iter_page_rows(record_id):
+    extracted = _checkpointed(record_id, "extract")
+    for part_no in range(extracted["parts"]):
+        yield from iter_jsonl(record_id, _pages_part_name(part_no))
 
 
 @shared_task
 def process_s3_file_task(record_id, s3_key):
-    print(" Starting file processing task...")
-    print(f"Record ID: {record_id}")
-    print(f" S3 Key: {s3_key}")
+    """
+    Entry point: launch (or resume) the staged ingestion workflow for one
+    upload. Stages that are already checkpointed are skipped.
+    """
+    if _checkpointed(record_id, "kb_sync") is not None:
+        print(f" Record {record_id} already fully ingested.")
+        _touch(record_id, status="completed")
+        return
+    if UploadRecord.objects.filter(id=record_id, duplicate_of__isnull=False).exists():
+        print(f" Record {record_id} is a duplicate upload; nothing to ingest.")
+        return
 
-    try:
-        record = UploadRecord.objects.get(id=record_id)
+    done = IngestionCheckpoint.objects.filter(record_id=record_id).count()
+    if done:
+        print(f" Resuming ingestion for record {record_id} ({done} checkpoints found)")
+    else:
+        print(f" Starting ingestion workflow for record {record_id} ({s3_key})")
 
-        print(" Downloading file from S3...")
+    steps = []
+    if _checkpointed(record_id, "extract") is None:
+        steps += [
+            ingest_download.si(record_id, s3_key),
+            ingest_extract.si(record_id, s3_key),
+        ]
+    steps.append(ingest_chunk.si(record_id))
+    chain(*steps).apply_async()
 
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
 
-   
-        ext = os.path.splitext(s3_key)[1] or ".pdf"
+@_stage(max_retries=5, retry_backoff_max=120)
+def ingest_download(self, record_id, s3_key):
+    _touch(record_id, status="processing", stage="download")
+    started = time.perf_counter()
+    last_report = [0]
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            s3.download_fileobj(settings.AWS_STORAGE_BUCKET_NAME, s3_key, tmp)
-            local_path = tmp.name
+    def progress(done, total):
+        # Report every ~5 MB instead of on every transfer callback
+        if done - last_report[0] >= 5 * 1024 * 1024 or done == total:
+            last_report[0] = done
+            _touch(record_id, bytes_downloaded=done, bytes_total=total)
 
-        print(f" Downloaded to: {local_path}")
-        record.status = "processing"
-        record.save()
+    print(" Downloading file from S3...")
+    local_path, downloaded = local_source(record_id, s3_key, progress)
+    print(f" {'Downloaded to' if downloaded else 'Already on disk at'}: {local_path}")
 
-        
-        print(" Extracting text from file...")
-        text = extract_text_from_file(local_path)
-        print(f" Extracted {len(text)} characters")
+    # Direct-to-S3 uploads are hashed here; streamed uploads already are
+    record = UploadRecord.objects.get(id=record_id)
+    content_hash = record.content_hash or _file_sha256(local_path)
+    original = find_duplicate(content_hash, before_id=record_id)
+    if original:
+        print(f" Record {record_id} duplicates record {original.id}; skipping ingestion")
+        _touch(record_id, content_hash=content_hash, duplicate_of=original,
+               status="duplicate", stage="done")
+        clear_work_dir(record_id)
+        # Drop the rest of the workflow chain
+        self.request.chain = None
+        return
+    if not record.content_hash:
+        _touch(record_id, content_hash=content_hash)
 
-       
-        print("Splitting text into chunks...")
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=120
-        )
-        chunks = splitter.split_text(text)
-        print(f" Total Chunks: {len(chunks)}")
+    if downloaded:
+        _checkpoint(record_id, "download", seconds=round(time.perf_counter() - started, 3))
+
+
+@_stage(max_retries=1, retry_backoff_max=60)
+def ingest_extract(self, record_id, s3_key):
+    """
+    Extract page texts into parts of INGEST_PAGES_PER_PART pages. Each part
+    is checkpointed, so an interrupted OCR run resumes after the last
+    finished part instead of from page 1.
+    """
+    _touch(record_id, stage="extract")
+    record = UploadRecord.objects.get(id=record_id)
+    local_path, _ = local_source(record_id, s3_key)
+
+    parts = list(
+        IngestionCheckpoint.objects
+        .filter(record_id=record_id, stage="extract_part")
+        .order_by("part")
+    )
+    last_page = parts[-1].data.get("last_page") if parts else None
+    if parts and last_page is None:
+        # Non-paged formats (TXT/DOCX) cannot resume mid-way; start over
+        IngestionCheckpoint.objects.filter(record_id=record_id, stage="extract_part").delete()
+        parts = []
+
+    next_part = len(parts)
+    start_page = last_page + 1 if parts else 1
+    extract_stats = {}
+    if parts and record.page_sources:
+        extract_stats["page_sources"] = {
+            source: [p for p in pages if p < start_page]
+            for source, pages in record.page_sources.items()
+        }
+
+    if start_page > 1:
+        print(f" Resuming extraction at page {start_page} (part {next_part})")
+    else:
+        print(" Extracting text page by page...")
+
+    part_started = time.perf_counter()
+    ocr_seconds_seen = 0.0
+    blocks_done = 0
+
+    def flush(rows):
+        nonlocal next_part, part_started, ocr_seconds_seen, blocks_done
+        write_jsonl(record_id, _pages_part_name(next_part), rows)
+
+        blocks_done += len(rows)
+        fields = {
+            "pages_done": rows[-1]["page"] or blocks_done,
+            "pages_total": extract_stats.get("page_count", 0),
+        }
+        if "page_sources" in extract_stats:
+            fields["page_sources"] = extract_stats["page_sources"]
+        _touch(record_id, **fields)
+
+        ocr_total = sum(extract_stats.get("ocr_page_seconds", {}).values())
+        _checkpoint(record_id, "extract_part", next_part,
+                    last_page=rows[-1]["page"], rows=len(rows),
+                    seconds=round(time.perf_counter() - part_started, 3),
+                    ocr_seconds=round(ocr_total - ocr_seconds_seen, 3))
+        ocr_seconds_seen = ocr_total
+        part_started = time.perf_counter()
+        next_part += 1
 
-      
-        print("Creating embeddings for chunks...")
+    rows = []
+    for page_no, text in iter_pages(local_path, extract_stats, start_page):
+        rows.append({"page": page_no, "text": text})
+        if len(rows) >= settings.INGEST_PAGES_PER_PART:
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
 
-        embeddings = []
-        for i, chunk in enumerate(chunks):
-            print(f"→ Embedding chunk {i+1}/{len(chunks)}")
+    print(f" Extracted text into {next_part} parts")
+    _checkpoint(record_id, "extract", parts=next_part)
 
-            res = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=chunk
-            )
+    # The source file is no longer needed on this host
+    clear_work_dir(record_id)
 
-            embeddings.append({
+
+@_stage(max_retries=2, retry_backoff_max=60)
+def ingest_chunk(self, record_id):
+    """Split pages into chunk shards, then fan out one embedding task per pending shard."""
+    _touch(record_id, status="processing", stage="chunk")
+    manifest = _checkpointed(record_id, "chunk")
+
+    if manifest is not None:
+        shard_count = manifest["shards"]
+        print(f" Chunk manifest already written ({shard_count} shards)")
+    else:
+        print("Splitting text into chunks...")
+        started = time.perf_counter()
+        chunker = TokenChunker()
+        record = UploadRecord.objects.select_related("replaces").get(id=record_id)
+        lineage_id = _lineage_id(record)
+        # Chunks the previous version already has in Pinecone
+        previous_ids = record_vector_ids(record.replaces) if record.replaces else set()
+
+        shard_count = 0
+        total_chunks = 0
+        shard = []
+        doc_chunks = {}
+        # Pages are chunked as one stream, so chunks run on across page breaks
+        pages = ((row["page"], row["text"]) for row in _iter_page_rows(record_id))
+        for page, chunk in chunker.split_pages(pages):
+            chunk_hash = text_hash(chunk)
+            vid = vector_id(lineage_id, chunk)
+            doc_chunks.setdefault(vid, DocumentChunk(
+                record_id=record_id, chunk_hash=chunk_hash, vector_id=vid, page=page
+            ))
+            shard.append({
+                "id": vid,
                 "text": chunk,
-                "embedding": res.data[0].embedding
+                "page": page,
+                "reused": vid in previous_ids,
             })
+            if len(shard) >= settings.INGEST_SHARD_CHUNKS:
+                total_chunks += write_jsonl(record_id, _shard_name(shard_count), shard)
+                shard_count += 1
+                shard = []
+        if shard:
+            total_chunks += write_jsonl(record_id, _shard_name(shard_count), shard)
+            shard_count += 1
 
-        print("Embedding completed.")
+        DocumentChunk.objects.filter(record_id=record_id).delete()
+        DocumentChunk.objects.bulk_create(doc_chunks.values(), batch_size=1000)
+        reused = len(previous_ids & doc_chunks.keys())
 
-        print(" Uploading embeddings to Pinecone...")
+        print(f" Total Chunks: {total_chunks} in {shard_count} shards")
+        print(f" Chunk stats: {chunker.stats}")
+        if record.replaces:
+            print(f" {reused} of {len(doc_chunks)} chunks unchanged from record {record.replaces_id}")
+        _touch(record_id, chunks_total=total_chunks, chunks_embedded=0,
+               chunk_stats=chunker.stats.as_dict())
+        _checkpoint(record_id, "chunk", shards=shard_count, chunks=total_chunks, reused=reused,
+                    seconds=round(time.perf_counter() - started, 3))
 
-        if len(embeddings) == 0:
-            print(" No embeddings to store. Skipping Pinecone upload.")
-        else:
-            store_into_pinecone(embeddings)
-            print("Pinecone store SUCCESS ")
+    pending = [
+        n for n in range(shard_count)
+        if _checkpointed(record_id, "embed", n) is None
+    ]
+    tail = chain(
+        ingest_upsert.si(record_id, shard_count),
+        ingest_kb_sync.si(record_id),
+    )
+    if UploadRecord.objects.filter(id=record_id, replaces__isnull=False).exists():
+        tail |= retire_replaced_record.si(record_id)
+    if not pending:
+        return self.replace(tail)
+    _touch(record_id, stage="embed")
+    return self.replace(chord(
+        [ingest_embed_shard.si(record_id, n) for n in pending],
+        tail,
+    ))
 
-  
-        print(" Updating ElevenLabs Knowledge Base...")
 
-        if len(text.strip()) == 0:
-            print(" No text found. Skipping ElevenLabs KB update.")
-        else:
-            print("Updating ElevenLabs agent with text chunk...=================")
-            el_res = update_elevenlabs_agent(text)
-            print(" ElevenLabs response:", el_res.status_code)
+@_stage(max_retries=8, retry_backoff_max=300)
+def ingest_embed_shard(self, record_id, shard_no):
+    if _checkpointed(record_id, "embed", shard_no) is not None:
+        return 0
+
+    started = time.perf_counter()
+    chunks = list(iter_jsonl(record_id, _shard_name(shard_no)))
+    # Reused chunks already have vectors from the previous version
+    embed_texts([c["text"] for c in chunks if not c.get("reused")])
+    # Count the shard together with its checkpoint, so a retry or a duplicate
+    # delivery of the task cannot count it twice
+    with transaction.atomic():
+        if _checkpoint(record_id, "embed", shard_no, chunks=len(chunks),
+                       seconds=round(time.perf_counter() - started, 3)):
+            _touch(record_id, chunks_embedded=F("chunks_embedded") + len(chunks))
+    print(f" Embedded shard {shard_no} ({len(chunks)} chunks)")
+    return len(chunks)
 
-            if el_res.status_code == 200:
-                print(" ElevenLabs KB UPDATE SUCCESS ")
-            else:
-                print(" ElevenLabs KB UPDATE FAILED")
 
-   
-        record.status = "completed"
-        record.save()
+@_stage(max_retries=6, retry_backoff_max=300)
+def ingest_upsert(self, record_id, shard_count):
+    _touch(record_id, stage="upsert")
+    print(" Uploading embeddings to Pinecone...")
+    if shard_count == 0:
+        print(" No embeddings to store. Skipping Pinecone upload.")
+        return
 
+    for shard_no in range(shard_count):
+        if _checkpointed(record_id, "upsert", shard_no) is not None:
+            continue
+        started = time.perf_counter()
+        rows = list(iter_jsonl(record_id, _shard_name(shard_no)))
+        chunks = [c for c in rows if not c.get("reused")]
+        # Cache hits: the embed shards stored these vectors
+        vectors = embed_texts([c["text"] for c in chunks])
+        # Read per shard so a category change during ingestion is picked up
+        category = UploadRecord.objects.values_list("category", flat=True).get(id=record_id)
+        result = store_into_pinecone(
+            (dict(c, embedding=v) for c, v in zip(chunks, vectors)),
+            record_id,
+            category,
+        )
+        # Reused chunks too: the lexical index is kept per record
+        indexed = index_chunks(record_id, rows)
+        _checkpoint(record_id, "upsert", shard_no, chunks=len(chunks),
+                    upserted=result["upserted"], batches=result["batches"], indexed=indexed,
+                    seconds=round(time.perf_counter() - started, 3))
+    # New vectors are searchable now; answers cached without them are stale
+    record = UploadRecord.objects.only("category").get(id=record_id)
+    invalidate_answers(category_tag(record.category))
+    print("Pinecone store SUCCESS ")
+
+
+@_stage(max_retries=5, retry_backoff_max=300)
+def ingest_kb_sync(self, record_id):
+    """Queue the record for the next coalesced KB sync."""
+    if _checkpointed(record_id, "kb_sync") is not None:
+        _touch(record_id, status="completed", stage="done")
         print(" Processing completed successfully.")
+        return
+
+    _touch(record_id, stage="kb_sync")
+    schedule_kb_sync()
+    print(" Queued for ElevenLabs KB sync")
+
+
+# ---------- Coalesced ElevenLabs KB sync ----------
+
+_KB_SCHEDULED_KEY = "kb-sync:scheduled"
+_KB_REMOVE_KEY = "kb-sync:remove"
+_KB_LOCK_KEY = "kb-sync:lock"
 
-    except Exception as e:
-        print(" ERROR in task:", str(e))
-        record.status = "failed"
-        record.error_message = str(e)
-        record.save()
+
+def schedule_kb_sync():
+    """Run sync_knowledge_base after the debounce window, unless one is already scheduled."""
+    debounce = settings.KB_SYNC_DEBOUNCE
+    # The flag expires on its own in case the scheduled task is lost
+    if get_redis().set(_KB_SCHEDULED_KEY, 1, nx=True, ex=max(60, debounce * 10)):
+        sync_knowledge_base.apply_async(countdown=debounce)
+
+
+def queue_kb_doc_removal(doc_ids):
+    """Detach and delete these KB docs in the next KB sync."""
+    doc_ids = [d for d in doc_ids if d]
+    if doc_ids:
+        get_redis().sadd(_KB_REMOVE_KEY, *doc_ids)
+        schedule_kb_sync()
+
+
+def _make_kb_doc(record_id, parts):
+    """Create the KB document of a record (runs in a worker thread; no DB access)."""
+    text = "".join(
+        row["text"]
+        for part_no in range(parts)
+        for row in iter_jsonl(record_id, _pages_part_name(part_no))
+    )
+    if not text.strip():
+        return None
+    return create_kb_doc(text, name_prefix=f"Upload {record_id}")
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=8)
+def sync_knowledge_base(self):
+    """
+    Sync every record waiting in the KB sync stage in one go: create their
+    KB documents concurrently, then add them (and drop the documents of the
+    versions they replace, or of deleted records) in a single agent update.
+    Runs under a Redis lock, so agent updates never race.
+    """
+    cache = get_redis()
+    cache.delete(_KB_SCHEDULED_KEY)
+    lock = cache.lock(_KB_LOCK_KEY, timeout=settings.KB_SYNC_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        print(" KB sync already running; rescheduling")
+        schedule_kb_sync()
+        return
+
+    try:
+        started = time.perf_counter()
+        batch = settings.KB_SYNC_MAX_BATCH
+        pending = list(
+            UploadRecord.objects
+            .filter(status="processing", stage="kb_sync")
+            .select_related("replaces")
+            .order_by("id")[:batch + 1]
+        )
+        more = len(pending) > batch
+        pending = pending[:batch]
+        remove_ids = {d.decode() for d in cache.smembers(_KB_REMOVE_KEY)}
+        if not pending and not remove_ids:
+            return
+
+        # KB docs created by an earlier, failed sync are reused
+        docs = {}
+        to_create = []
+        for record in pending:
+            made = _checkpointed(record.id, "kb_doc")
+            if made is not None:
+                docs[record.id] = made["doc"]
+            else:
+                to_create.append(record)
+
+        failed = []
+        if to_create:
+            workers = max(1, min(settings.KB_SYNC_WORKERS, len(to_create)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    (r, pool.submit(_make_kb_doc, r.id, _checkpointed(r.id, "extract")["parts"]))
+                    for r in to_create
+                ]
+                for record, future in futures:
+                    try:
+                        doc = future.result()
+                    except Exception as e:
+                        print(f" KB doc for record {record.id} failed:", e)
+                        failed.append(record.id)
+                        continue
+                    docs[record.id] = doc
+                    _checkpoint(record.id, "kb_doc", doc=doc)
+                    if doc:
+                        _touch(record.id, kb_doc_id=doc["id"])
+
+        done = [r for r in pending if r.id in docs]
+        replaced = [r.replaces for r in done if r.replaces and r.replaces.kb_doc_id]
+        remove_ids |= {p.kb_doc_id for p in replaced}
+        add_docs = [docs[r.id] for r in done if docs[r.id]]
+
+        if add_docs or remove_ids:
+            update_agent_knowledge_base(settings.ELEVENLABS_AGENT_ID, add_docs, sorted(remove_ids))
+
+        seconds = round(time.perf_counter() - started, 3)
+        for record in done:
+            _checkpoint(record.id, "kb_sync", seconds=seconds)
+            _touch(record.id, status="completed", stage="done")
+        for previous in replaced:
+            _touch(previous.id, kb_doc_id=None)
+
+        delete_kb_docs(sorted(remove_ids))
+        if remove_ids:
+            cache.srem(_KB_REMOVE_KEY, *remove_ids)
+        print(f" ElevenLabs KB sync: {len(add_docs)} docs added, {len(remove_ids)} removed, "
+              f"{len(done)} records completed in {seconds:.1f}s")
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass  # expired; another sync may already hold it
+
+    if failed:
+        raise RuntimeError(f"KB doc creation failed for records {failed}")
+    if more:
+        schedule_kb_sync()
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def retire_replaced_record(self, record_id):
+    """
+    Once a new version is live, delete the vectors of chunks it no longer
+    contains and mark the old version "replaced".
+    Failures here never affect the status of the new version.
+    """
+    record = UploadRecord.objects.select_related("replaces").get(id=record_id)
+    previous = record.replaces
+    if previous is None or previous.status == "replaced":
+        return
+
+    current_ids = record_vector_ids(record)
+    previous_ids = record_vector_ids(previous)
+    removed = unshared_vector_ids(previous, previous_ids - current_ids)
+    print(f" Retiring record {previous.id}: {len(removed)} removed chunks")
+    delete_vectors(removed)
+
+    # Vectors carried over still name the old record in their metadata
+    metadata = {"record_id": record.id, "category": category_tag(record.category) or ""}
+    update_vector_metadata(previous_ids & current_ids, metadata)
+    invalidate_answers(category_tag(previous.category), category_tag(record.category))
+
+    # The old KB document is swapped out by the KB sync of the new version
+    previous.chunks.all().delete()
+    invalidate_corpus_stats()
+    delete_artifacts(previous.id)
+    _touch(previous.id, status="replaced", stage="done")
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def sync_record_category(self, record_id, previous_category=None):
+    """Propagate UploadRecord.category to the metadata of all of its vectors."""
+    record = UploadRecord.objects.get(id=record_id)
+    ids = record_vector_ids(record)
+    print(f" Setting category {record.category!r} on {len(ids)} vectors of record {record_id}")
+    update_vector_metadata(ids, {"category": category_tag(record.category) or ""})
+    invalidate_answers(category_tag(previous_category), category_tag(record.category))
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def purge_record_vectors(self, record_id, vector_ids, kb_doc_id=None, category=None):
+    """Remove what a deleted UploadRecord left in Pinecone, ElevenLabs and S3."""
+    print(f" Purging deleted record {record_id}: {len(vector_ids)} vectors")
+    delete_vectors(vector_ids)
+    invalidate_answers(category_tag(category))
+    invalidate_corpus_stats()
+    queue_kb_doc_removal([kb_doc_id])
+    delete_artifacts(record_id)
+
+
+@shared_task
+def resume_stale_ingestions():
+    """
+    Periodic sweeper (see CELERY_BEAT_SCHEDULE): re-launch ingestion for
+    records whose workflow has started but not reported progress for
+    INGEST_STALE_AFTER seconds, e.g. because a worker was killed. Records
+    still waiting in the queue for their first stage are left alone. Gives
+    up after INGEST_MAX_RESUMES attempts.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.INGEST_STALE_AFTER)
+    stale = (
+        UploadRecord.objects
+        .filter(Q(status="processing") | Q(status="uploaded") & ~Q(stage=""))
+        # Records that started before heartbeats existed fall back to updated_at
+        .filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, updated_at__lt=cutoff))
+        .exclude(s3_key__isnull=True)
+    )
+
+    cache = get_redis()
+    for record in stale:
+        # One resume per stale window, even if sweeps overlap
+        if not cache.set(f"ingest:resume:{record.id}", 1, nx=True, ex=settings.INGEST_STALE_AFTER):
+            continue
+
+        if record.resume_count >= settings.INGEST_MAX_RESUMES:
+            print(f" Record {record.id} stalled {record.resume_count} times; marking failed")
+            _touch(record.id, status="failed",
+                   error=f"Ingestion stalled after {record.resume_count} resumes")
+            continue
+
+        print(f" Resuming stale ingestion for record {record.id}")
+        _touch(record.id, resume_count=F("resume_count") + 1)
+        process_s3_file_task.delay(record.id, record.s3_key)
+
+
+@shared_task
+def evict_embedding_cache():
+    """Periodic (see CELERY_BEAT_SCHEDULE): keep the embedding cache within EMBEDDING_CACHE_MAX_ENTRIES."""
+    return evict_cache()
@@ -1,3 +1,586 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chatbot import answer_cache, clients
+from chatbot.chunking import TokenChunker
+from chatbot.embedding_utils import (
+    MAX_INPUT_TOKENS,
+    _embed_uncached,
+    embed_texts,
+    evict_cache,
+    make_batches,
+    text_hash,
+)
+from chatbot.extract_utils import iter_pages, page_text_ok
+from chatbot.lexical import hybrid_search, index_chunks, lexical_search, reciprocal_rank_fusion, tokenize
+from chatbot.media_utils import plan_split_points
+from chatbot.models import AnswerCacheEntry, DocumentChunk, EmbeddingCache, UploadRecord
+from chatbot.pinecone_utils import make_upsert_batches
+from chatbot.tasks import retire_replaced_record
+from chatbot.upload_handlers import S3StreamingMultiPartParser
+from chatbot.utils_upload import file_sha256, find_duplicate
+from chatbot.vectorstores import LocalStore
+from chatbot.views import FileUploadViewed
+
+
+def _call_with_timeout(testcase, fn, timeout=5):
+    """Run `fn` on a thread and fail instead of hanging if it deadlocks."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", fn()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    testcase.assertFalse(thread.is_alive(), f"{fn.__name__} did not return on a cold registry")
+    return result["value"]
+
+
+@override_settings(PINECONE_INDEX_HOST="", PINECONE_INDEX_NAME="test-index")
+class ClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        clients.reset_clients()
+        self.addCleanup(clients.reset_clients)
+        self.pinecone = mock.Mock()
+        self.pinecone.describe_index.return_value.host = "test-host"
+        patcher = mock.patch("chatbot.clients._pinecone", return_value=self.pinecone)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cold_pinecone_index(self):
+        index = _call_with_timeout(self, clients.get_pinecone_index)
+        self.assertIs(index, self.pinecone.Index.return_value)
+        self.pinecone.Index.assert_called_once_with(host="test-host")
+
+    def test_clients_are_shared(self):
+        self.assertIs(clients.get_pinecone_index(), clients.get_pinecone_index())
+        self.pinecone.describe_index.assert_called_once_with("test-index")
+
+    @override_settings(VECTOR_BACKEND="pinecone")
+    def test_cold_pinecone_vector_store(self):
+        from chatbot.vectorstores import PineconeStore
+
+        store = _call_with_timeout(self, clients.get_vector_store)
+        self.assertIsInstance(store, PineconeStore)
+        self.assertIs(store.index, self.pinecone.Index.return_value)
+
+
+class LocalStoreTests(SimpleTestCase):
+    dtype = "float16"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = tmp.name
+        self.store = LocalStore(self.path, dtype=self.dtype)
+
+    def _vectors(self):
+        return [
+            {"id": "a", "values": [1, 0, 0], "metadata": {"category": "herbs", "text": "a"}},
+            {"id": "b", "values": [0.8, 0.6, 0], "metadata": {"category": "faith", "text": "b"}},
+            {"id": "c", "values": [0, 0, 2], "metadata": {"category": "herbs", "text": "c"}},
+        ]
+
+    def test_upsert_and_query(self):
+        self.store.upsert(self._vectors())
+        matches = self.store.query([1, 0, 0], top_k=2)
+        self.assertEqual([m["id"] for m in matches], ["a", "b"])
+        self.assertAlmostEqual(matches[0]["score"], 1.0, places=2)
+        self.assertAlmostEqual(matches[1]["score"], 0.8, places=2)
+        self.assertEqual(matches[0]["metadata"]["text"], "a")
+        self.assertEqual(self.store.fetch_ids(["a", "c", "x"]), {"a", "c"})
+
+    def test_overwrite_replaces_vector_and_metadata(self):
+        self.store.upsert(self._vectors())
+        self.store.upsert([{"id": "a", "values": [0, 0, 1], "metadata": {"text": "new"}}])
+        matches = self.store.query([0, 0, 1], top_k=3)
+        self.assertEqual(sorted(m["id"] for m in matches[:2]), ["a", "c"])
+        self.assertEqual(len(matches), 3)
+        self.assertEqual(next(m for m in matches if m["id"] == "a")["metadata"], {"text": "new"})
+
+    def test_delete(self):
+        self.store.upsert(self._vectors())
+        self.store.delete(["a", "missing"])
+        self.assertEqual(self.store.fetch_ids(["a", "b", "c"]), {"b", "c"})
+        self.assertNotIn("a", [m["id"] for m in self.store.query([1, 0, 0], top_k=3)])
+
+    def test_filter(self):
+        self.store.upsert(self._vectors())
+        matches = self.store.query([1, 0, 0], top_k=3, filter={"category": "herbs"})
+        self.assertEqual([m["id"] for m in matches], ["a", "c"])
+        matches = self.store.query([1, 0, 0], top_k=3, filter={"category": {"$in": ["faith"]}})
+        self.assertEqual([m["id"] for m in matches], ["b"])
+        self.store.update_metadata(["c"], {"category": "faith"})
+        matches = self.store.query([1, 0, 0], top_k=3, filter={"category": {"$ne": "herbs"}})
+        self.assertEqual([m["id"] for m in matches], ["b", "c"])
+
+    def test_compact_keeps_live_rows(self):
+        self.store.upsert(self._vectors())
+        self.store.upsert([{"id": "b", "values": [0, 1, 0], "metadata": {"text": "b2"}}])
+        self.store.delete(["c"])
+        self.store.compact()
+
+        # A fresh instance reads only what is on disk
+        store = LocalStore(self.path, dtype=self.dtype)
+        self.assertEqual(sorted(store.list_ids("")), ["a", "b"])
+        self.assertEqual(len(store._ids), 2)
+        matches = store.query([0, 1, 0], top_k=2)
+        self.assertEqual([m["id"] for m in matches], ["b", "a"])
+        self.assertEqual(matches[0]["metadata"], {"text": "b2"})
+        self.assertAlmostEqual(matches[0]["score"], 1.0, places=2)
+
+    def test_other_instance_sees_writes(self):
+        reader = LocalStore(self.path, dtype=self.dtype)
+        self.assertEqual(reader.query([1, 0, 0]), [])
+        self.store.upsert(self._vectors())
+        self.assertEqual(reader.query([1, 0, 0], top_k=1)[0]["id"], "a")
+
+    def test_async_batches_and_queries(self):
+        vectors = self._vectors()
+        sent = asyncio.run(self.store.aupsert_batches([vectors[:2], vectors[2:]], concurrency=2))
+        self.assertEqual(sent, 3)
+        results = asyncio.run(self.store.aquery_many(
+            [{"vector": [1, 0, 0], "top_k": 1}, {"vector": [0, 0, 1], "top_k": 1, "filter": {"category": "herbs"}}],
+            concurrency=2,
+        ))
+        self.assertEqual([[m["id"] for m in r] for r in results], [["a"], ["c"]])
+
+    def test_dimension_mismatch(self):
+        self.store.upsert(self._vectors())
+        with self.assertRaises(ValueError):
+            self.store.upsert([{"id": "d", "values": [1, 0]}])
+        with self.assertRaises(ValueError):
+            self.store.query([1, 0])
+
+
+class Int8LocalStoreTests(LocalStoreTests):
+    dtype = "int8"
+
+    def test_scores_match_float16(self):
+        rng = np.random.default_rng(0)
+        vectors = [{"id": f"v{i}", "values": rng.standard_normal(64).tolist()} for i in range(50)]
+        query = rng.standard_normal(64).tolist()
+        self.store.upsert(vectors)
+        with tempfile.TemporaryDirectory() as path:
+            reference = LocalStore(path, dtype="float16")
+            reference.upsert(vectors)
+            expected = {m["id"]: m["score"] for m in reference.query(query, top_k=50)}
+        for match in self.store.query(query, top_k=50):
+            self.assertAlmostEqual(match["score"], expected[match["id"]], delta=0.02)
+
+
+class IterPagesTests(SimpleTestCase):
+    def test_media_transcript_is_yielded_as_pages(self):
+        transcript = iter(["[00:00:00] First segment\n", "[00:10:00] Second segment\n"])
+        with mock.patch("chatbot.extract_utils.iter_media_transcript", return_value=transcript) as transcribe:
+            pages = list(iter_pages("/tmp/talk.mp3"))
+        transcribe.assert_called_once_with("/tmp/talk.mp3")
+        self.assertEqual(pages, [(None, "[00:00:00] First segment\n"), (None, "[00:10:00] Second segment\n")])
+
+
+@override_settings(OCR_MIN_PAGE_CHARS=20, OCR_MIN_PRINTABLE_RATIO=0.9, OCR_MIN_WHITESPACE_RATIO=0.05,
+                   OCR_MAX_WHITESPACE_RATIO=0.5, OCR_MIN_MEAN_RUN_LENGTH=2.0)
+class PageTextOkTests(SimpleTestCase):
+    def test_accepts_prose(self):
+        self.assertTrue(page_text_ok("Arnica is used for bruises and sprains.\nApply it twice a day."))
+
+    def test_accepts_scripts_without_spaces(self):
+        self.assertTrue(page_text_ok("東京は日本の首都であり、世界で最も人口の多い都市圏の一つです。"))
+        self.assertTrue(page_text_ok("ภาษาไทยเป็นภาษาที่ไม่มีการเว้นวรรคระหว่างคำในประโยคทั่วไป"))
+
+    def test_rejects_short_pages(self):
+        self.assertFalse(page_text_ok("  Page 3  "))
+
+    def test_rejects_unprintable_layers(self):
+        self.assertFalse(page_text_ok("��� broken ��� encoding ����"))
+
+    def test_rejects_run_together_glyphs(self):
+        self.assertFalse(page_text_ok("Arnicaisusedforbruisesandsprainsapplyittwiceaday"))
+
+    def test_rejects_one_character_per_line(self):
+        self.assertFalse(page_text_ok("\n".join("abcdefghijklmnopqrstuvwxyz")))
+        self.assertFalse(page_text_ok(" ".join("abcdefghijklmnopqrstuvwxyz")))
+
+
+class ReplacementTests(TestCase):
+    def setUp(self):
+        self.original = UploadRecord.objects.create(
+            original_name="remedies.pdf", content_hash="a" * 64, status="completed", category="Herbs"
+        )
+        self.replacement = UploadRecord.objects.create(
+            original_name="remedies.pdf", content_hash="b" * 64, status="completed", category="Herbs",
+            replaces=self.original, lineage_id=self.original.id,
+        )
+        for record, ids in ((self.original, ["v1", "v2"]), (self.replacement, ["v1", "v3"])):
+            for vid in ids:
+                DocumentChunk.objects.create(record=record, chunk_hash=vid, vector_id=vid)
+        for name in ("delete_vectors", "update_vector_metadata", "delete_artifacts"):
+            patcher = mock.patch(f"chatbot.tasks.{name}")
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_rollback_upload_is_not_a_duplicate(self):
+        retire_replaced_record(self.replacement.id)
+
+        self.original.refresh_from_db()
+        self.assertEqual(self.original.status, "replaced")
+        self.assertIsNone(find_duplicate("a" * 64))
+        self.assertEqual(find_duplicate("b" * 64), self.replacement)
+
+    def test_only_removed_chunks_lose_their_vectors(self):
+        retire_replaced_record(self.replacement.id)
+
+        self.delete_vectors.assert_called_once_with({"v2"})
+        self.update_vector_metadata.assert_called_once_with(
+            {"v1"}, {"record_id": self.replacement.id, "category": "herbs"}
+        )
+        self.assertFalse(DocumentChunk.objects.filter(record=self.original).exists())
+        self.assertEqual(
+            set(DocumentChunk.objects.filter(record=self.replacement).values_list("vector_id", flat=True)),
+            {"v1", "v3"},
+        )
+
+    def test_vectors_shared_with_other_records_are_kept(self):
+        other = UploadRecord.objects.create(original_name="copy.pdf", status="completed")
+        DocumentChunk.objects.create(record=other, chunk_hash="v2", vector_id="v2")
+
+        retire_replaced_record(self.replacement.id)
+        self.delete_vectors.assert_called_once_with(set())
+
+
+class UpsertBatchTests(SimpleTestCase):
+    def _vector(self, n, text="x"):
+        return {"id": f"v{n}", "values": [0.5] * 4, "metadata": {"text": text}}
+
+    @override_settings(PINECONE_UPSERT_BATCH_SIZE=3, PINECONE_UPSERT_MAX_BYTES=10 ** 6)
+    def test_batches_by_count(self):
+        batches = list(make_upsert_batches(self._vector(n) for n in range(7)))
+        self.assertEqual([len(b) for b, _ in batches], [3, 3, 1])
+        self.assertEqual([v["id"] for b, _ in batches for v in b], [f"v{n}" for n in range(7)])
+
+    def test_batches_by_bytes(self):
+        size = len(json.dumps(self._vector(0, "y" * 100), separators=(",", ":")))
+        with self.settings(PINECONE_UPSERT_BATCH_SIZE=100, PINECONE_UPSERT_MAX_BYTES=size * 2):
+            batches = list(make_upsert_batches(self._vector(n, "y" * 100) for n in range(5)))
+        self.assertEqual([len(b) for b, _ in batches], [2, 2, 1])
+        self.assertTrue(all(n_bytes <= size * 2 for _, n_bytes in batches))
+
+    @override_settings(PINECONE_UPSERT_BATCH_SIZE=10, PINECONE_UPSERT_MAX_BYTES=10)
+    def test_oversized_vector_gets_own_batch(self):
+        batches = list(make_upsert_batches([self._vector(0), self._vector(1)]))
+        self.assertEqual([len(b) for b, _ in batches], [1, 1])
+
+    def test_empty(self):
+        self.assertEqual(list(make_upsert_batches([])), [])
+
+
+@override_settings(ANSWER_CACHE_TTL=3600, ANSWER_CACHE_THRESHOLD=0.95, ANSWER_CACHE_SCAN_LIMIT=50)
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        answer_cache.store_answer([1, 0, 0], "Herbs", "fp", "What is arnica?", "A remedy.")
+
+    def test_hit_on_similar_question(self):
+        self.assertEqual(answer_cache.lookup_answer([0.99, 0.05, 0], "Herbs", "fp"), "A remedy.")
+        self.assertEqual(AnswerCacheEntry.objects.get().hits, 1)
+
+    def test_miss_below_threshold(self):
+        self.assertIsNone(answer_cache.lookup_answer([0.7, 0.7, 0], "Herbs", "fp"))
+
+    def test_miss_on_other_context_or_category(self):
+        self.assertIsNone(answer_cache.lookup_answer([1, 0, 0], "Herbs", "other"))
+        self.assertIsNone(answer_cache.lookup_answer([1, 0, 0], "Faith", "fp"))
+
+    def test_miss_on_other_dimensions(self):
+        self.assertIsNone(answer_cache.lookup_answer([1, 0, 0, 0], "Herbs", "fp"))
+
+    def test_expired_entries_are_ignored(self):
+        AnswerCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(answer_cache.lookup_answer([1, 0, 0], "Herbs", "fp"))
+
+    @override_settings(ANSWER_CACHE_TTL=0)
+    def test_disabled(self):
+        self.assertIsNone(answer_cache.lookup_answer([1, 0, 0], "Herbs", "fp"))
+
+
+class TokenizeTests(SimpleTestCase):
+    def test_lowercases_and_drops_stopwords(self):
+        self.assertEqual(tokenize("What is the Dosage of Arnica?"), ["dosage", "arnica"])
+
+    def test_compound_tokens_keep_parts(self):
+        self.assertEqual(tokenize("John 3:16"), ["john", "3:16", "3", "16"])
+        self.assertEqual(tokenize("B-12"), ["b-12", "b", "12"])
+
+    def test_normalizes_unicode(self):
+        self.assertEqual(tokenize("ＣＡＦÉ Straße"), ["café", "strasse"])
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+    def test_fuses_rankings(self):
+        vector = [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.8}]
+        lexical = [{"id": "b", "score": 12.0}, {"id": "c", "score": 3.0}]
+        fused = reciprocal_rank_fusion(vector, lexical, k=60)
+        self.assertEqual([m["id"] for m in fused], ["b", "a", "c"])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 62 + 1 / 61)
+        self.assertAlmostEqual(fused[1]["score"], 1 / 61)
+
+    def test_keeps_first_seen_match(self):
+        fused = reciprocal_rank_fusion([{"id": "a", "metadata": {"src": "vector"}}],
+                                       [{"id": "a", "metadata": {"src": "bm25"}}])
+        self.assertEqual(fused[0]["metadata"], {"src": "vector"})
+
+    def test_empty(self):
+        self.assertEqual(reciprocal_rank_fusion([], []), [])
+
+
+def _fake_vectors(texts):
+    return [[float(len(t)), 1.0] for t in texts]
+
+
+@override_settings(EMBEDDING_MODEL="test-model", EMBEDDING_DIMENSIONS=0, EMBEDDING_CACHE_MAX_ENTRIES=2)
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("chatbot.embedding_utils._embed_uncached", side_effect=_fake_vectors)
+        self.embed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_texts_are_not_embedded_again(self):
+        self.assertEqual(embed_texts(["arnica", "rue", "arnica"]), [[6.0, 1.0], [3.0, 1.0], [6.0, 1.0]])
+        self.embed.assert_called_once_with(["arnica", "rue"])
+
+        # Whitespace differences hash the same
+        self.assertEqual(embed_texts([" arnica ", "sage"]), [[6.0, 1.0], [4.0, 1.0]])
+        self.assertEqual(self.embed.call_args.args, (["sage"],))
+        self.assertEqual(EmbeddingCache.objects.count(), 3)
+
+    def test_storing_does_not_evict(self):
+        embed_texts(["arnica", "rue", "sage"])
+        self.assertEqual(EmbeddingCache.objects.count(), 3)
+
+    def test_evict_drops_least_recently_used(self):
+        embed_texts(["arnica", "rue", "sage"])
+        now = timezone.now()
+        for age, text in enumerate(["sage", "arnica", "rue"]):
+            EmbeddingCache.objects.filter(text_hash=text_hash(text)).update(
+                last_used_at=now - timedelta(minutes=age)
+            )
+        self.assertEqual(evict_cache(), 1)
+        self.assertFalse(EmbeddingCache.objects.filter(text_hash=text_hash("rue")).exists())
+        self.assertEqual(evict_cache(), 0)
+
+
+class _WordEncoding:
+    """One token per word, so token counts are easy to reason about."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@override_settings(EMBEDDING_MODEL="test-model", EMBEDDING_DIMENSIONS=0, EMBEDDING_MAX_IN_FLIGHT=3)
+class EmbeddingBatchTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("chatbot.embedding_utils.get_encoding", return_value=_WordEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(EMBEDDING_BATCH_MAX_TOKENS=5, EMBEDDING_BATCH_MAX_INPUTS=10)
+    def test_batches_by_tokens(self):
+        batches = make_batches(["a b", "c d", "e f", "g"])
+        self.assertEqual(batches, [(["a b", "c d"], 4), (["e f", "g"], 3)])
+
+    @override_settings(EMBEDDING_BATCH_MAX_TOKENS=100, EMBEDDING_BATCH_MAX_INPUTS=2)
+    def test_batches_by_inputs(self):
+        self.assertEqual([b for b, _ in make_batches(["a", "b", "c"])], [["a", "b"], ["c"]])
+
+    @override_settings(EMBEDDING_BATCH_MAX_TOKENS=10 ** 6, EMBEDDING_BATCH_MAX_INPUTS=10)
+    def test_truncates_oversized_input(self):
+        [(texts, tokens)] = make_batches(["w " * (MAX_INPUT_TOKENS + 10)])
+        self.assertEqual(tokens, MAX_INPUT_TOKENS)
+        self.assertEqual(len(texts[0].split()), MAX_INPUT_TOKENS)
+
+    @override_settings(EMBEDDING_BATCH_MAX_TOKENS=2, EMBEDDING_BATCH_MAX_INPUTS=10)
+    def test_vectors_keep_input_order(self):
+        def create(model, input):
+            # The API may answer out of order; the echoed index says which input is which
+            data = [mock.Mock(index=i, embedding=[float(len(t))]) for i, t in enumerate(input)]
+            return mock.Mock(data=data[::-1])
+
+        client = mock.Mock()
+        client.embeddings.create.side_effect = create
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        with mock.patch("chatbot.embedding_utils.get_openai", return_value=client):
+            vectors = _embed_uncached(texts)
+        self.assertEqual(vectors, [[1.0], [2.0], [3.0], [4.0], [5.0]])
+        self.assertEqual(client.embeddings.create.call_count, 3)
+
+
+class SplitPlanTests(SimpleTestCase):
+    def test_short_media_is_not_split(self):
+        self.assertEqual(plan_split_points(500, [100, 300], target=600, max_len=900), [])
+
+    def test_cuts_snap_to_nearest_silence(self):
+        points = plan_split_points(2000, [400, 580, 700, 1250, 1500], target=600, max_len=900)
+        self.assertEqual(points, [580, 1250])
+
+    def test_hard_cut_without_silence(self):
+        self.assertEqual(plan_split_points(2000, [], target=600, max_len=900), [600, 1200])
+
+    def test_segments_stay_under_max_len(self):
+        points = plan_split_points(5000, [10, 1000, 1001, 2500, 4000], target=600, max_len=900)
+        bounds = [0] + points + [5000]
+        self.assertTrue(all(b - a <= 900 for a, b in zip(bounds, bounds[1:])))
+
+
+class ContentHashDedupTests(TestCase):
+    def _record(self, status="completed", **fields):
+        return UploadRecord.objects.create(original_name="a.pdf", content_hash="c" * 64, status=status, **fields)
+
+    def test_oldest_original_is_found(self):
+        first = self._record()
+        self._record(status="duplicate", duplicate_of=first)
+        self._record()
+        self.assertEqual(find_duplicate("c" * 64), first)
+        self.assertIsNone(find_duplicate("d" * 64))
+        self.assertIsNone(find_duplicate(None))
+
+    def test_failed_and_pending_uploads_are_not_originals(self):
+        self._record(status="failed")
+        self._record(status="awaiting_upload")
+        self.assertIsNone(find_duplicate("c" * 64))
+
+    def test_only_earlier_records_count(self):
+        first = self._record(status="processing")
+        second = self._record(status="uploaded")
+        self.assertEqual(find_duplicate("c" * 64, before_id=second.id), first)
+        self.assertIsNone(find_duplicate("c" * 64, before_id=first.id))
+
+    def test_file_hash_rewinds_the_file(self):
+        upload = SimpleUploadedFile("a.txt", b"same content")
+        self.assertEqual(file_sha256(upload), hashlib.sha256(b"same content").hexdigest())
+        self.assertEqual(upload.read(), b"same content")
+
+
+class TokenChunkerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("chatbot.chunking.get_encoding", return_value=_WordEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_are_chunked_as_one_stream(self):
+        pages = [(1, "Alpha beta. Gamma delta."), (2, "Epsilon zeta. Eta theta."), (3, "Iota kappa.")]
+        chunker = TokenChunker(chunk_tokens=6, overlap_tokens=0)
+        self.assertEqual(list(chunker.split_pages(pages)), [
+            (1, "Alpha beta. Gamma delta.\n\nEpsilon zeta."),
+            (2, "Eta theta.\n\nIota kappa."),
+        ])
+        self.assertEqual(chunker.stats.chunks, 2)
+
+    def test_chunks_stay_within_size_and_share_overlap(self):
+        chunker = TokenChunker(chunk_tokens=6, overlap_tokens=2)
+        self.assertEqual(chunker.split_text("A b. C d. E f. G h."), ["A b. C d. E f.", "E f. G h."])
+        self.assertEqual(chunker.stats.max_tokens, 6)
+
+    def test_heading_starts_a_new_chunk(self):
+        chunker = TokenChunker(chunk_tokens=6, overlap_tokens=2)
+        text = "Alpha beta gamma delta.\n\nSECTION TWO\nEpsilon zeta."
+        self.assertEqual(chunker.split_text(text), ["Alpha beta gamma delta.", "SECTION TWO\nEpsilon zeta."])
+
+    def test_long_sentence_is_cut_on_token_boundaries(self):
+        chunker = TokenChunker(chunk_tokens=4, overlap_tokens=0)
+        words = " ".join(f"w{i}" for i in range(1, 11)) + "."
+        self.assertEqual(chunker.split_text(words), ["w1 w2 w3 w4", "w5 w6 w7 w8", "w9 w10."])
+
+
+@override_settings(AWS_STORAGE_BUCKET_NAME="test-bucket", STREAM_UPLOAD_PART_SIZE=0, STREAM_UPLOAD_MAX_IN_FLIGHT=2)
+class StreamingUploadViewTests(TestCase):
+    def setUp(self):
+        self.s3 = mock.Mock()
+        self.s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+        self.s3.upload_part.return_value = {"ETag": "etag"}
+        for target, value in (("chatbot.upload_handlers.s3_client", self.s3),
+                              ("chatbot.views.delete_upload", None),
+                              ("chatbot.views.process_s3_file_task", None)):
+            patcher = mock.patch(target, return_value=value) if value else mock.patch(target)
+            setattr(self, target.rsplit(".", 1)[1], patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def _post(self, user, field="file"):
+        request = APIRequestFactory().post(
+            "/upload/", {field: SimpleUploadedFile("notes.txt", b"Arnica for bruises.")}, format="multipart"
+        )
+        if user:
+            force_authenticate(request, user=user)
+        return FileUploadViewed.as_view()(request)
+
+    def _user(self, role):
+        return get_user_model().objects.create_user(email=f"{role}@example.com", password="x", role=role)
+
+    def test_anonymous_and_non_admin_uploads_never_reach_s3(self):
+        self.assertIn(self._post(None).status_code, (401, 403))
+        self.assertEqual(self._post(self._user("user")).status_code, 403)
+        self.s3.create_multipart_upload.assert_not_called()
+
+    def test_parser_refuses_non_admins(self):
+        request = Request(APIRequestFactory().post("/upload/", {}, format="multipart"))
+        request.user = AnonymousUser()
+        with self.assertRaises(PermissionDenied):
+            S3StreamingMultiPartParser().parse(mock.Mock(), parser_context={"request": request})
+        self.s3.create_multipart_upload.assert_not_called()
+
+    def test_file_under_another_field_is_deleted(self):
+        response = self._post(self._user("admin"), field="document")
+        self.assertEqual(response.status_code, 400)
+        key = self.s3.create_multipart_upload.call_args.kwargs["Key"]
+        self.delete_upload.assert_called_once_with(key)
+
+    def test_admin_upload_starts_processing(self):
+        response = self._post(self._user("admin"))
+        self.assertEqual(response.status_code, 201)
+        record = UploadRecord.objects.get()
+        self.assertEqual(record.role, "admin")
+        self.assertEqual(record.s3_key, self.s3.create_multipart_upload.call_args.kwargs["Key"])
+        self.delete_upload.assert_not_called()
+        self.process_s3_file_task.delay.assert_called_once_with(record.id, record.s3_key)
+
+
+_LOCAL_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "default"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "shared"},
+}
+
+
+@override_settings(CACHES=_LOCAL_CACHES, BM25_K1=1.2, BM25_B=0.75, BM25_MAX_DF_RATIO=1.0,
+                   RETRIEVAL_TOP_K=5, RETRIEVAL_CANDIDATES=10, RETRIEVAL_VECTOR_THREADS=2, RRF_K=60)
+class CategorySearchTests(TestCase):
+    def setUp(self):
+        caches["shared"].clear()
+        for n, category in enumerate([" Herbs ", "Faith", None]):
+            record = UploadRecord.objects.create(original_name=f"{n}.pdf", status="completed", category=category)
+            DocumentChunk.objects.create(record=record, chunk_hash=f"h{n}", vector_id=f"v{n}")
+            index_chunks(record.id, [{"id": f"v{n}", "text": f"Arnica remedy notes, part {n}."}])
+
+    def test_bm25_category_matches_the_vector_tag(self):
+        matches = lexical_search("arnica", category="HERBS ")
+        self.assertEqual([m["id"] for m in matches], ["v0"])
+        self.assertEqual(matches[0]["metadata"]["category"], "herbs")
+
+    def test_both_retrievers_get_the_same_category(self):
+        with mock.patch("chatbot.lexical.query_index", return_value=[]) as query_index:
+            results = hybrid_search("arnica", [0.1, 0.2], category=" Herbs")
+        self.assertEqual(query_index.call_args.kwargs["filter"], {"category": "herbs"})
+        self.assertEqual([m["id"] for m in results], ["v0"])
@@ -0,0 +1,153 @@
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+
+from .utils_upload import MIN_PART_SIZE, make_upload_key, s3_client
+
+
+class S3UploadedFile(UploadedFile):
+    """An uploaded file whose bytes are already in S3 at `s3_key`."""
+
+    def __init__(self, name, content_type, size, charset, s3_key, sha256):
+        super().__init__(file=None, name=name, content_type=content_type, size=size, charset=charset)
+        self.s3_key = s3_key
+        self.sha256 = sha256
+
+    def open(self, mode=None):
+        raise ValueError("S3UploadedFile has no local content; read it from S3 via s3_key.")
+
+
+class S3MultipartUploadHandler(FileUploadHandler):
+    """
+    Forward an incoming multipart file field straight into an S3 multipart
+    upload as the request body arrives.
+
+    Data is buffered up to STREAM_UPLOAD_PART_SIZE, then sent as one part
+    on a background thread while the client keeps sending; at most
+    STREAM_UPLOAD_MAX_IN_FLIGHT parts are pending, so memory per upload is
+    bounded and nothing is spooled to disk. A sha256 of the content is
+    computed on the fly. The view receives an S3UploadedFile.
+    """
+
+    chunk_size = 256 * 1024
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        self.part_size = max(settings.STREAM_UPLOAD_PART_SIZE, MIN_PART_SIZE)
+        self.s3 = s3_client()
+        self.key = make_upload_key(file_name)
+        self.upload_id = self.s3.create_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=self.key,
+            ContentType=content_type or "application/octet-stream",
+            ACL="private",
+        )["UploadId"]
+
+        self.buffer = bytearray()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.parts = []
+        self.pending = deque()
+        self.pool = ThreadPoolExecutor(max_workers=settings.STREAM_UPLOAD_MAX_IN_FLIGHT)
+
+        # This handler consumes the file; don't let later handlers spool it too
+        raise StopFutureHandlers()
+
+    def _upload_part(self, part_number, body):
+        res = self.s3.upload_part(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"PartNumber": part_number, "ETag": res["ETag"]}
+
+    def _collect(self, wait_for):
+        """Collect finished parts, blocking until at most `wait_for` are pending."""
+        while self.pending and (len(self.pending) > wait_for or self.pending[0].done()):
+            self.parts.append(self.pending.popleft().result())
+
+    def _send_buffer(self):
+        part_number = len(self.parts) + len(self.pending) + 1
+        body = bytes(self.buffer)
+        self.buffer = bytearray()
+        self._collect(settings.STREAM_UPLOAD_MAX_IN_FLIGHT - 1)
+        self.pending.append(self.pool.submit(self._upload_part, part_number, body))
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        self.size += len(raw_data)
+        self.buffer += raw_data
+        try:
+            if len(self.buffer) >= self.part_size:
+                self._send_buffer()
+        except Exception:
+            self._abort()
+            raise
+        # Swallow the chunk; nothing is passed on to other handlers
+        return None
+
+    def file_complete(self, file_size):
+        try:
+            if self.buffer or not (self.parts or self.pending):
+                self._send_buffer()
+            self._collect(0)
+            self.s3.complete_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": sorted(self.parts, key=lambda p: p["PartNumber"])},
+            )
+        except Exception:
+            self._abort()
+            raise
+        finally:
+            self.pool.shutdown(wait=False)
+
+        print(f" Streamed {self.size} bytes to s3://{settings.AWS_STORAGE_BUCKET_NAME}/{self.key} "
+              f"in {len(self.parts)} parts")
+        return S3UploadedFile(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            s3_key=self.key,
+            sha256=self.sha256.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, "upload_id", None):
+            self._abort()
+
+    def _abort(self):
+        # Let in-flight parts finish (and drop queued ones) so none lands after the abort
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        try:
+            self.s3.abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=self.key, UploadId=self.upload_id
+            )
+        except Exception as e:
+            print(" Abort multipart upload failed:", e)
+        self.upload_id = None
+
+
+class S3StreamingMultiPartParser(MultiPartParser):
+    """
+    MultiPartParser that streams file fields to S3 with S3MultipartUploadHandler.
+    Only admins may upload; anyone else is refused before anything is written.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context["request"]
+        if getattr(request.user, "role", None) != "admin":
+            raise PermissionDenied("Only admin can upload")
+        request._request.upload_handlers = [S3MultipartUploadHandler(request._request)]
+        return super().parse(stream, media_type, parser_context)
@@ -1,11 +1,14 @@
 from django.urls import path
-from .views import CancelSubscriptionView, ChatHistoryView, FirebaseGoogleAuthView, GetSignedURLView, ShowAllFileList, UpdateFileCategory, stripe_webhook,CreatePremiumSubscriptionView,CreateTopUpCheckoutView,FileUploadView ,UploadStatusView ,FileUploadViewed , QueryView, UserAllChatsView ,VoiceResponseView, TextToVoiceView, user_plan_info
+from .views import CancelSubscriptionView, ChatHistoryView, FirebaseGoogleAuthView, GetSignedURLView, ShowAllFileList, UpdateFileCategory, stripe_webhook,CreatePremiumSubscriptionView,CreateTopUpCheckoutView,FileUploadView ,UploadStatusView ,FileUploadViewed , FileUploadInitView, FileUploadCompleteView, QueryView, QueryCacheStatsView, UserAllChatsView ,VoiceResponseView, TextToVoiceView, user_plan_info
 
 urlpatterns = [
     path('upload/', FileUploadView.as_view(), name='upload-file'),
     path("upload-file/", FileUploadViewed.as_view(), name="upload"),
+    path("upload-init/", FileUploadInitView.as_view(), name="upload-init"),
+    path("upload-complete/", FileUploadCompleteView.as_view(), name="upload-complete"),
     path("upload-status/<int:record_id>/", UploadStatusView.as_view(), name="upload-status"),
     path("query/", QueryView.as_view(), name="query"), 
+    path("query-cache-stats/", QueryCacheStatsView.as_view(), name="query-cache-stats"),
     path("chat/history/", ChatHistoryView.as_view(), name="chat-history"),
     path("chat/all/", UserAllChatsView.as_view(), name="user-all-chats"),
     path('voice-response/', VoiceResponseView.as_view(), name='voice-response'),
@@ -1,16 +1,12 @@
 import uuid
-import boto3
 import os
 from django.conf import settings
 
+from .clients import get_s3
+
 
 def upload_to_s3(file_obj):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    s3 = get_s3()
 
     original_name = os.path.splitext(file_obj.name)[0]  
     file_extension = os.path.splitext(file_obj.name)[1]  
@@ -1,20 +1,18 @@
 import os
 import tempfile
-import boto3
+import uuid
 from django.conf import settings
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
 from PIL import Image
 import pytesseract
-from moviepy.editor import VideoFileClip
 
-CHUNK_SIZE = 400
-CHUNK_OVERLAP = 200
+from .answer_cache import invalidate_answers
+from .chunking import TokenChunker
+from .clients import get_s3, get_vector_store
+from .embedding_utils import CachedEmbeddings
+from .media_utils import is_media, transcribe_media
+from .pinecone_utils import make_upsert_batches
 
 def extract_documents_from_file(file_path, file_key):
     docs = []
@@ -26,20 +24,9 @@ def extract_documents_from_file(file_path, file_key):
     elif lower.endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
         text = pytesseract.image_to_string(Image.open(file_path))
         docs.append(Document(page_content=text, metadata={"source": file_key}))
-    elif lower.endswith((".mp3", ".wav", ".m4a")):
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        with open(file_path, "rb") as f:
-            transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
-        docs.append(Document(page_content=transcript.text, metadata={"source": file_key}))
-    elif lower.endswith((".mp4", ".mkv", ".avi", ".mov")):
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        video = VideoFileClip(file_path)
-        tmp_audio = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        video.audio.write_audiofile(tmp_audio.name, verbose=False, logger=None)
-        video.close()
-        with open(tmp_audio.name, "rb") as f:
-            transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
-        docs.append(Document(page_content=transcript.text, metadata={"source": file_key}))
+    elif is_media(lower):
+        transcript = transcribe_media(file_path)
+        docs.append(Document(page_content=transcript, metadata={"source": file_key}))
     else:
  
         try:
@@ -51,13 +38,11 @@ def extract_documents_from_file(file_path, file_key):
     return docs
 
 def process_file_from_s3(file_key):
-    """Download private file from S3, extract text, split, embed, upload to Pinecone"""
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    """
+    Download private file from S3, extract text, split, embed, upload to the vector store.
+    Has no DocumentChunk rows, so its chunks are not in the BM25 index (see lexical).
+    """
+    s3 = get_s3()
 
     tmp_file = tempfile.NamedTemporaryFile(delete=False)
     s3.download_file(settings.AWS_STORAGE_BUCKET_NAME, file_key, tmp_file.name)
@@ -69,23 +54,19 @@ def process_file_from_s3(file_key):
         return {"success": False, "message": "No documents extracted"}
 
  
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    chunks = splitter.split_documents(docs)
+    chunker = TokenChunker()
+    chunks = chunker.split_documents(docs)
+    print(f"Chunk stats: {chunker.stats}")
 
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-    if settings.PINECONE_INDEX_NAME not in [i["name"] for i in pc.list_indexes()]:
-        pc.create_index(
-            name=settings.PINECONE_INDEX_NAME,
-            dimension=1536,
-            metric="cosine",
-        )
-
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=settings.OPENAI_API_KEY)
-    vectorstore = PineconeVectorStore.from_existing_index(
-        index_name=settings.PINECONE_INDEX_NAME,
-        embedding=embeddings
-    )
-    vectorstore.add_documents(chunks)
+    vectors = CachedEmbeddings().embed_documents([c.page_content for c in chunks])
+    store = get_vector_store()
+    for batch, _ in make_upsert_batches(
+        {"id": str(uuid.uuid4()), "values": v, "metadata": {**c.metadata, "text": c.page_content}}
+        for c, v in zip(chunks, vectors)
+    ):
+        store.upsert(batch)
+    # Uncategorized vectors only show up in unfiltered queries
+    invalidate_answers()
 
     return {"success": True, "chunks": len(chunks)}
 
@@ -1,19 +1,31 @@
+import hashlib
+import math
 import uuid
-import boto3
 import os
 from django.conf import settings
 
-def upload_to_s3(file_obj):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+from .clients import get_s3
+from .models import UploadRecord
+
+# S3 multipart limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def s3_client():
+    return get_s3()
+
+
+def make_upload_key(file_name):
+    file_name = os.path.basename(file_name)
+    original_name = os.path.splitext(file_name)[0]
+    file_extension = os.path.splitext(file_name)[1]
+    return f"uploads/{uuid.uuid4()}_{original_name}{file_extension}"
+
 
-    original_name = os.path.splitext(file_obj.name)[0]
-    file_extension = os.path.splitext(file_obj.name)[1]
-    file_key = f"uploads/{uuid.uuid4()}_{original_name}{file_extension}"
+def upload_to_s3(file_obj):
+    s3 = s3_client()
+    file_key = make_upload_key(file_obj.name)
 
     s3.upload_fileobj(
         Fileobj=file_obj,
@@ -25,3 +37,104 @@ def upload_to_s3(file_obj):
         },
     )
     return file_key
+
+
+# ---------- Direct-to-S3 multipart uploads ----------
+
+def start_multipart_upload(file_name, content_type, file_size):
+    """
+    Open an S3 multipart upload and presign one PUT URL per part, so the
+    client can send the file bytes straight to S3.
+
+    The bucket CORS configuration must allow PUT from the frontend origin
+    and expose the ETag header, which the client needs for completion.
+    """
+    part_size = max(settings.UPLOAD_PART_SIZE, MIN_PART_SIZE, math.ceil(file_size / MAX_PARTS))
+    part_count = max(1, math.ceil(file_size / part_size))
+
+    s3 = s3_client()
+    key = make_upload_key(file_name)
+    upload = s3.create_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        ContentType=content_type or "application/octet-stream",
+        ACL="private",
+    )
+
+    parts = [
+        {
+            "part_number": n,
+            "url": s3.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": settings.AWS_STORAGE_BUCKET_NAME,
+                    "Key": key,
+                    "UploadId": upload["UploadId"],
+                    "PartNumber": n,
+                },
+                ExpiresIn=settings.UPLOAD_URL_EXPIRES,
+            ),
+        }
+        for n in range(1, part_count + 1)
+    ]
+    return {
+        "key": key,
+        "upload_id": upload["UploadId"],
+        "part_size": part_size,
+        "parts": parts,
+        "expires_in": settings.UPLOAD_URL_EXPIRES,
+    }
+
+
+def complete_multipart_upload(key, upload_id, parts):
+    """`parts` is a list of {"part_number", "etag"} as reported by the client."""
+    s3_client().complete_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": sorted(
+                ({"PartNumber": int(p["part_number"]), "ETag": p["etag"]} for p in parts),
+                key=lambda p: p["PartNumber"],
+            )
+        },
+    )
+
+
+def abort_multipart_upload(key, upload_id):
+    s3_client().abort_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, UploadId=upload_id
+    )
+
+
+def delete_upload(key):
+    s3_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+
+
+# ---------- Content-hash deduplication ----------
+
+def file_sha256(file_obj):
+    """sha256 of an uploaded file, leaving it rewound for the S3 upload."""
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def find_duplicate(content_hash, before_id=None):
+    """
+    The original upload with this content, if any: the oldest record with
+    the same hash that is not itself a duplicate, has not failed and has
+    not been replaced by a newer version (its vectors are gone, so
+    re-uploading it, e.g. to roll back, must ingest it again).
+    `before_id` restricts the search to records created before that one.
+    """
+    if not content_hash:
+        return None
+    qs = UploadRecord.objects.filter(
+        content_hash=content_hash, duplicate_of__isnull=True
+    ).exclude(status__in=["failed", "awaiting_upload", "replaced"])
+    if before_id is not None:
+        qs = qs.filter(id__lt=before_id)
+    return qs.order_by("id").first()
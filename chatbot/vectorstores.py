@@ -0,0 +1,478 @@
+"""
+Vector index backends.
+
+Ingestion, retrieval and maintenance go through `get_vector_store()`
+(clients.py), which returns the backend selected by VECTOR_BACKEND:
+
+- "pinecone" (default): PineconeStore, the hosted index.
+- "local": LocalStore, an exact-search index in VECTOR_STORE_DIR on the
+  local disk, shared by every process on the host.
+
+Both take and return plain Python data: vectors are
+{"id", "values", "metadata"} dicts, matches are {"id", "score", "metadata"}.
+`aquery_many` and `aupsert_batches` run many queries or upsert batches
+with bounded concurrency: on Pinecone's asyncio client, or on threads.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .clients import get_pinecone, get_pinecone_index, pinecone_index_host
+
+try:
+    import simsimd
+except ImportError:  # numpy fallback
+    simsimd = None
+
+FETCH_BATCH_SIZE = 200
+# Pinecone accepts at most 1000 IDs per delete request
+DELETE_BATCH_SIZE = 1000
+
+
+class VectorStore:
+    """What the app needs from a vector index."""
+
+    name = ""
+
+    def fetch_ids(self, ids):
+        """Return the subset of `ids` that is stored."""
+        raise NotImplementedError
+
+    def upsert(self, vectors):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def update_metadata(self, ids, metadata):
+        """Set `metadata` fields on every vector in `ids`."""
+        raise NotImplementedError
+
+    def list_ids(self, prefix):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=3, filter=None):
+        """Nearest vectors to `vector`, best first, as [{"id", "score", "metadata"}]."""
+        raise NotImplementedError
+
+    async def aquery_many(self, queries, concurrency):
+        """
+        Run query() for each keyword dict in `queries`, at most `concurrency`
+        at a time. Returns the matches of each query, in order.
+        """
+        return await _gather_bounded(
+            [lambda q=q: asyncio.to_thread(self.query, **q) for q in queries], concurrency
+        )
+
+    async def aupsert_batches(self, batches, concurrency):
+        """Upsert pre-built batches, at most `concurrency` at a time. Returns the number of vectors."""
+        await _gather_bounded([lambda b=b: asyncio.to_thread(self.upsert, b) for b in batches], concurrency)
+        return sum(len(b) for b in batches)
+
+
+async def _gather_bounded(calls, concurrency):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(c) for c in calls))
+
+
+# ---------- Pinecone ----------
+
+def _match(m):
+    return {"id": m.id, "score": m.score, "metadata": dict(m.metadata or {})}
+
+
+class PineconeStore(VectorStore):
+    name = "pinecone"
+
+    def __init__(self, index):
+        self.index = index
+
+    def fetch_ids(self, ids):
+        ids = list(ids)
+        found = set()
+        for i in range(0, len(ids), FETCH_BATCH_SIZE):
+            res = self.index.fetch(ids=ids[i:i + FETCH_BATCH_SIZE])
+            found.update(res.vectors.keys())
+        return found
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=vectors)
+
+    def delete(self, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[i:i + DELETE_BATCH_SIZE])
+
+    def update_metadata(self, ids, metadata):
+        # Pinecone updates one vector per request
+        with ThreadPoolExecutor(max_workers=settings.PINECONE_UPSERT_WORKERS) as pool:
+            list(pool.map(lambda vid: self.index.update(id=vid, set_metadata=metadata), ids))
+
+    def list_ids(self, prefix):
+        # Serverless indexes only
+        ids = []
+        for page in self.index.list(prefix=prefix):
+            ids.extend(page)
+        return ids
+
+    def query(self, vector, top_k=3, filter=None):
+        res = self.index.query(vector=vector, top_k=top_k, filter=filter, include_metadata=True)
+        return [_match(m) for m in res.matches]
+
+    # One asyncio connection per call instead of a thread per request
+    async def aquery_many(self, queries, concurrency):
+        async with get_pinecone().IndexAsyncio(host=pinecone_index_host()) as index:
+            results = await _gather_bounded(
+                [lambda q=q: index.query(include_metadata=True, **q) for q in queries], concurrency
+            )
+        return [[_match(m) for m in res.matches] for res in results]
+
+    async def aupsert_batches(self, batches, concurrency):
+        async with get_pinecone().IndexAsyncio(host=pinecone_index_host()) as index:
+            await _gather_bounded([lambda b=b: index.upsert(vectors=b) for b in batches], concurrency)
+        return sum(len(b) for b in batches)
+
+
+# ---------- Local ----------
+
+_FILTER_OPS = {"$eq", "$ne", "$in", "$nin"}
+_SCORE_BLOCK = 16384  # rows converted to float32 at a time by the numpy fallback
+
+
+def _matches(metadata, filter):
+    """Evaluate the subset of Pinecone's metadata filter syntax used here."""
+    for field, cond in filter.items():
+        value = metadata.get(field)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            if op not in _FILTER_OPS:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+            if op == "$eq" and value != arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+    return True
+
+
+class LocalStore(VectorStore):
+    """
+    Exact top-k search over a memory-mapped matrix on the local disk.
+
+    Vectors are normalized to unit length and stored as float16, or as int8
+    with a float32 scale per row (VECTOR_STORE_DTYPE), in `vectors.bin`;
+    IDs and metadata live in an append-only operation log (`log.jsonl`).
+    Scores are cosine similarities, computed with SIMD dot products when
+    `simsimd` is installed and with numpy otherwise.
+
+    Writers append under an exclusive file lock and every call first reads
+    the log entries added since the last one, so vectors upserted by a
+    worker are searchable right away by every other process. Deleted and
+    overwritten rows stay in the files until compact(), which runs on its
+    own once most rows are dead.
+    """
+
+    name = "local"
+
+    def __init__(self, path, dtype="float16"):
+        self.path = path
+        self.default_dtype = dtype
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _reset(self):
+        self.dims = None
+        self.dtype = None
+        self._log_inode = None
+        self._log_offset = 0
+        self._ids = []       # row -> id, None once dead
+        self._metadata = []  # row -> metadata, None once dead
+        self._row_of = {}    # id -> live row
+        self._dead = 0
+        self._matrix = None
+        self._scales = None
+        self._masks = {}
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+    # -- files --
+
+    @contextmanager
+    def _flock(self, mode):
+        with open(self._file("lock"), "a") as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _row_bytes(self):
+        return self.dims * self.dtype.itemsize
+
+    def _load_meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        self.dims, self.dtype = meta["dims"], np.dtype(meta["dtype"])
+
+    def _init_meta(self, dims):
+        self.dims, self.dtype = dims, np.dtype(self.default_dtype)
+        with open(self._file("meta.json"), "w") as f:
+            json.dump({"dims": dims, "dtype": self.dtype.name}, f)
+
+    def _apply(self, entry):
+        op, vid = entry["op"], entry["id"]
+        if op == "add":
+            row = entry["row"]
+            self._forget(vid)
+            while len(self._ids) <= row:
+                self._ids.append(None)
+                self._metadata.append(None)
+            self._ids[row] = vid
+            self._metadata[row] = entry["metadata"]
+            self._row_of[vid] = row
+        elif op == "delete":
+            self._forget(vid)
+        elif op == "update":
+            row = self._row_of.get(vid)
+            if row is not None:
+                self._metadata[row] = dict(self._metadata[row], **entry["set"])
+
+    def _forget(self, vid):
+        row = self._row_of.pop(vid, None)
+        if row is not None:
+            self._ids[row] = None
+            self._metadata[row] = None
+            self._dead += 1
+
+    def _refresh_locked(self):
+        """Apply log entries written since the last call. Caller holds a file lock."""
+        try:
+            f = open(self._file("log.jsonl"), "rb")
+        except FileNotFoundError:
+            if self._ids:
+                self._reset()
+            return
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._log_inode:
+                # New store, or compacted by another process
+                self._reset()
+                self._log_inode = inode
+                self._load_meta()
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        for line in data[:end].splitlines():
+            self._apply(json.loads(line))
+        self._log_offset += end
+        self._masks = {}
+        self._map()
+
+    def _map(self):
+        rows = len(self._ids)
+        if not rows:
+            self._matrix = self._scales = None
+            return
+        self._matrix = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r",
+                                 shape=(rows, self.dims))
+        if self.dtype == np.int8:
+            self._scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r", shape=(rows,))
+
+    def refresh(self):
+        with self._lock:
+            try:
+                st = os.stat(self._file("log.jsonl"))
+                if st.st_ino == self._log_inode and st.st_size == self._log_offset:
+                    return
+            except FileNotFoundError:
+                if not self._ids:
+                    return
+            with self._flock(fcntl.LOCK_SH):
+                self._refresh_locked()
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, self._flock(fcntl.LOCK_EX):
+            self._refresh_locked()
+            yield
+            self._refresh_locked()
+
+    def _append_log(self, entries):
+        with open(self._file("log.jsonl"), "a") as f:
+            f.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+
+    def _encode(self, matrix):
+        """Unit-normalize float32 rows and convert them to the storage dtype."""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        if self.dtype != np.int8:
+            return matrix.astype(self.dtype), None
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _write_rows(self, start, rows, scales):
+        # Drop bytes a crashed writer may have appended past the last logged row
+        with open(self._file("vectors.bin"), "ab") as f:
+            f.truncate(start * self._row_bytes())
+            f.write(rows.tobytes())
+        if scales is not None:
+            with open(self._file("scales.bin"), "ab") as f:
+                f.truncate(start * 4)
+                f.write(scales.tobytes())
+
+    # -- writes --
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        with self._writing():
+            matrix = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            if self.dims is None:
+                self._init_meta(matrix.shape[1])
+            if matrix.shape[1] != self.dims:
+                raise ValueError(f"Expected {self.dims}-dimensional vectors, got {matrix.shape[1]}")
+            rows, scales = self._encode(matrix)
+            start = len(self._ids)
+            self._write_rows(start, rows, scales)
+            self._append_log(
+                {"op": "add", "id": v["id"], "row": start + i, "metadata": v.get("metadata") or {}}
+                for i, v in enumerate(vectors)
+            )
+
+    def delete(self, ids):
+        with self._writing():
+            self._append_log({"op": "delete", "id": vid} for vid in ids if vid in self._row_of)
+        live = len(self._row_of)
+        if self._dead > max(1024, live):
+            self.compact()
+
+    def update_metadata(self, ids, metadata):
+        with self._writing():
+            self._append_log(
+                {"op": "update", "id": vid, "set": metadata} for vid in ids if vid in self._row_of
+            )
+
+    def compact(self):
+        """Rewrite the files without dead rows."""
+        with self._writing():
+            live = [row for row, vid in enumerate(self._ids) if vid is not None]
+            if len(live) == len(self._ids):
+                return
+            started = time.perf_counter()
+            tmp = self._file("vectors.bin.tmp")
+            self._matrix[live].tofile(tmp)
+            if self._scales is not None:
+                self._scales[live].tofile(self._file("scales.bin.tmp"))
+            with open(self._file("log.jsonl.tmp"), "w") as f:
+                for new_row, row in enumerate(live):
+                    f.write(json.dumps({
+                        "op": "add", "id": self._ids[row], "row": new_row, "metadata": self._metadata[row],
+                    }, separators=(",", ":")) + "\n")
+            # The log goes last: readers reload everything when its inode changes
+            os.replace(tmp, self._file("vectors.bin"))
+            if self._scales is not None:
+                os.replace(self._file("scales.bin.tmp"), self._file("scales.bin"))
+            os.replace(self._file("log.jsonl.tmp"), self._file("log.jsonl"))
+            dropped = len(self._ids) - len(live)
+        print(f"🧹 Compacted local vector store: dropped {dropped} rows, kept {len(live)} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+    # -- reads --
+
+    def fetch_ids(self, ids):
+        self.refresh()
+        with self._lock:
+            return {vid for vid in ids if vid in self._row_of}
+
+    def list_ids(self, prefix):
+        self.refresh()
+        with self._lock:
+            return [vid for vid in self._row_of if vid.startswith(prefix)]
+
+    def _mask(self, filter):
+        """Boolean mask of live rows matching `filter`; cached until the log changes."""
+        key = json.dumps(filter, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            rows = self._metadata
+            if filter:
+                mask = np.fromiter((m is not None and _matches(m, filter) for m in rows), bool, len(rows))
+            else:
+                mask = np.fromiter((m is not None for m in rows), bool, len(rows))
+            mask = self._masks[key] = (mask, int(mask.sum()))
+        return mask
+
+    def _scores(self, matrix, scales, vector):
+        query, query_scale = self._encode(np.asarray([vector], dtype=np.float32))
+        if simsimd is not None:
+            scores = np.asarray(simsimd.cdist(query, matrix, metric="dot"), dtype=np.float32)[0]
+        else:
+            q = query[0].astype(np.float32)
+            scores = np.empty(len(matrix), dtype=np.float32)
+            for i in range(0, len(matrix), _SCORE_BLOCK):
+                scores[i:i + _SCORE_BLOCK] = matrix[i:i + _SCORE_BLOCK].astype(np.float32) @ q
+        if scales is not None:
+            scores *= scales * query_scale[0]
+        return scores
+
+    def query(self, vector, top_k=3, filter=None):
+        self.refresh()
+        with self._lock:
+            matrix, scales = self._matrix, self._scales
+            if matrix is None:
+                return []
+            if len(vector) != self.dims:
+                raise ValueError(f"Expected a {self.dims}-dimensional query vector, got {len(vector)}")
+            mask, candidates = self._mask(filter)
+
+        k = min(top_k, candidates)
+        if not k:
+            return []
+        scores = np.where(mask, self._scores(matrix, scales, vector), -np.inf)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        with self._lock:
+            return [
+                {"id": self._ids[row], "score": float(scores[row]), "metadata": dict(self._metadata[row])}
+                for row in top if row < len(self._ids) and self._ids[row] is not None
+            ]
+
+
+def make_vector_store():
+    backend = settings.VECTOR_BACKEND
+    if backend == "local":
+        return LocalStore(settings.VECTOR_STORE_DIR, dtype=settings.VECTOR_STORE_DTYPE)
+    if backend == "pinecone":
+        return PineconeStore(get_pinecone_index())
+    raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}")
@@ -37,41 +37,103 @@ from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
 
-from .utils_upload import upload_to_s3
+from .utils_upload import (
+    abort_multipart_upload,
+    complete_multipart_upload,
+    delete_upload,
+    file_sha256,
+    find_duplicate,
+    start_multipart_upload,
+    upload_to_s3,
+)
+from .upload_handlers import S3StreamingMultiPartParser
 from .models import UploadRecord
-from .tasks import process_s3_file_task
+from .tasks import process_s3_file_task, sync_record_category
 from .serializers import UploadRecordSerializer
 
 
+def _replaced_record(request):
+    """
+    The record named by the optional `replaces` field, i.e. the previous
+    version of the uploaded document. Returns (record or None, error response).
+    """
+    replaces = request.data.get("replaces")
+    if not replaces:
+        return None, None
+    try:
+        return UploadRecord.objects.exclude(status__in=["replaced", "duplicate"]).get(id=replaces), None
+    except (UploadRecord.DoesNotExist, ValueError, TypeError):
+        return None, Response({"error": "Document to replace not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+def _discard_streamed_files(request, keep=None):
+    """Delete the S3 objects of streamed file fields, except `keep`."""
+    for field in request.FILES:
+        for f in request.FILES.getlist(field):
+            if f is not keep and getattr(f, "s3_key", None):
+                delete_upload(f.s3_key)
+
+
 class FileUploadViewed(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+    """
+    Upload a document. Send `replaces=<record id>` to upload a new version
+    of an existing document: only changed chunks are embedded, and removed
+    chunks are deleted from the index once the new version is live.
+    """
+    permission_classes = [IsAuthenticated]
+    # File fields are streamed into S3 while the request body is read
+    parser_classes = [S3StreamingMultiPartParser, FormParser]
 
     def post(self, request):
-        role = request.data.get("role")
-        if not role or role.lower() != "admin":
+        # Checked before request.data is read, i.e. before anything is streamed
+        if request.user.role != "admin":
             return Response({"error": "Only admin can upload"}, status=status.HTTP_403_FORBIDDEN)
 
         if "file" not in request.FILES:
+            _discard_streamed_files(request)
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         file_obj = request.FILES["file"]
+        previous, error = _replaced_record(request)
+        if error:
+            _discard_streamed_files(request)
+            return error
+
+        content_hash = getattr(file_obj, "sha256", None) or file_sha256(file_obj)
+
+        original = find_duplicate(content_hash)
+        if original:
+            _discard_streamed_files(request)
+            return Response({
+                "message": "File already uploaded; not processed again",
+                "duplicate": True,
+                "record": UploadRecordSerializer(original).data
+            }, status=status.HTTP_200_OK)
 
         try:
-            # Upload to S3
-            s3_key = upload_to_s3(file_obj)
+            # Already in S3 when streamed by the parser
+            s3_key = getattr(file_obj, "s3_key", None) or upload_to_s3(file_obj)
         except Exception as e:
+            _discard_streamed_files(request)
             return Response({
                 "error": "S3 upload failed",
                 "detail": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        # Only `file` is ingested; drop anything streamed under other fields
+        _discard_streamed_files(request, keep=file_obj)
+
         # Create DB record
         record = UploadRecord.objects.create(
-            role=role.lower(),
+            role=request.user.role,
             original_name=file_obj.name,
             s3_key=s3_key,
+            content_hash=content_hash,
+            replaces=previous,
+            category=request.data.get("category") or (previous.category if previous else None),
             status="uploaded"
         )
 
@@ -82,11 +144,134 @@ class FileUploadViewed(APIView):
 
         return Response({
             "message": "File uploaded to S3 and processing started",
+            "duplicate": False,
             "record": serializer.data
         }, status=status.HTTP_201_CREATED)
 
 
 
+class FileUploadInitView(APIView):
+    """
+    Step 1 of a direct-to-S3 upload: create the UploadRecord and return
+    presigned multipart URLs. The client PUTs each part to its URL and then
+    calls FileUploadCompleteView with the returned ETags.
+
+    If the client sends the file's sha256 as `content_hash` and that content
+    was uploaded before, no upload is started and the existing record is
+    returned. The hash is verified again once the file is downloaded.
+    `replaces` works as in FileUploadViewed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role != "admin":
+            return Response({"error": "Only admin can upload"}, status=status.HTTP_403_FORBIDDEN)
+
+        file_name = request.data.get("file_name")
+        content_type = request.data.get("content_type")
+        try:
+            file_size = int(request.data.get("file_size", 0))
+        except (TypeError, ValueError):
+            file_size = 0
+
+        if not file_name or file_size <= 0:
+            return Response({"error": "file_name and file_size are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        previous, error = _replaced_record(request)
+        if error:
+            return error
+
+        original = find_duplicate((request.data.get("content_hash") or "").lower())
+        if original:
+            return Response({
+                "message": "File already uploaded; not processed again",
+                "duplicate": True,
+                "record": UploadRecordSerializer(original).data
+            }, status=status.HTTP_200_OK)
+
+        try:
+            upload = start_multipart_upload(file_name, content_type, file_size)
+        except Exception as e:
+            return Response({
+                "error": "S3 upload initiation failed",
+                "detail": str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        record = UploadRecord.objects.create(
+            role=request.user.role,
+            original_name=file_name,
+            s3_key=upload["key"],
+            upload_id=upload["upload_id"],
+            uploaded_by=request.user,
+            replaces=previous,
+            category=request.data.get("category") or (previous.category if previous else None),
+            status="awaiting_upload"
+        )
+
+        return Response({
+            "duplicate": False,
+            "record_id": record.id,
+            "part_size": upload["part_size"],
+            "parts": upload["parts"],
+            "expires_in": upload["expires_in"],
+        }, status=status.HTTP_201_CREATED)
+
+
+class FileUploadCompleteView(APIView):
+    """
+    Step 2 of a direct-to-S3 upload: complete the multipart upload and start
+    processing. Body: {"record_id": ..., "parts": [{"part_number", "etag"}]}.
+    Send {"record_id": ..., "abort": true} to cancel the upload instead.
+    Only the admin who started the upload can complete or abort it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role != "admin":
+            return Response({"error": "Only admin can upload"}, status=status.HTTP_403_FORBIDDEN)
+
+        record_id = request.data.get("record_id")
+        try:
+            record = UploadRecord.objects.get(id=record_id, status="awaiting_upload", uploaded_by=request.user)
+        except (UploadRecord.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Pending upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.data.get("abort"):
+            try:
+                abort_multipart_upload(record.s3_key, record.upload_id)
+            except Exception as e:
+                print(" Abort multipart upload failed:", e)
+            record.delete()
+            return Response({"message": "Upload aborted"}, status=status.HTTP_200_OK)
+
+        parts = request.data.get("parts")
+        if not parts:
+            return Response({"error": "parts are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            complete_multipart_upload(record.s3_key, record.upload_id, parts)
+        except Exception as e:
+            return Response({
+                "error": "S3 upload completion failed",
+                "detail": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        record.status = "uploaded"
+        record.upload_id = None
+        record.save(update_fields=["status", "upload_id", "updated_at"])
+
+        # Trigger Celery process
+        process_s3_file_task.delay(record.id, record.s3_key)
+
+        serializer = UploadRecordSerializer(record)
+
+        return Response({
+            "message": "File uploaded to S3 and processing started",
+            "record": serializer.data
+        }, status=status.HTTP_200_OK)
+
+
+
 
 
 
@@ -173,9 +358,11 @@ class ShowAllFileList(APIView):
             return Response({"error": "File not found"}, status=404)
 
         # only update if category provided
-        if new_category:
+        if new_category and new_category != rec.category:
+            previous_category = rec.category
             rec.category = new_category
             rec.save(update_fields=["category"])
+            sync_record_category.delay(rec.id, previous_category)
 
         return Response({
             "file_id": rec.id,
@@ -205,9 +392,11 @@ class UpdateFileCategory(APIView):
             return Response({"error": "File not found"}, status=404)
 
        
-        if new_category:
+        if new_category and new_category != record.category:
+            previous_category = record.category
             record.category = new_category
             record.save(update_fields=["category"])
+            sync_record_category.delay(record.id, previous_category)
 
         return Response({
             "file_id": record.id,
@@ -236,11 +425,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
+from .clients import get_openai
 from rest_framework.permissions import IsAuthenticated
 from .models import ChatSession, QueryHistory
+from .embedding_utils import CachedEmbeddings, query_cache_report
+from .pinecone_utils import category_tag
+from .lexical import hybrid_search
+from .answer_cache import answer_cache_stats, context_fingerprint, lookup_answer, store_answer
 
 class QueryView(APIView):
     permission_classes = [IsAuthenticated]
@@ -251,6 +442,8 @@ class QueryView(APIView):
 
         query = request.data.get("query")
         chat_id = request.data.get("chat_id")  
+        # Optional: only search documents of this category
+        category = category_tag(request.data.get("category"))
 
         if not query:
             return Response({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -267,17 +460,30 @@ class QueryView(APIView):
 
         try:
 
-            embeddings = OpenAIEmbeddings(
-                model="text-embedding-3-small",
-                api_key=settings.OPENAI_API_KEY
-            )
-            vectorstore = PineconeVectorStore.from_existing_index(
-                index_name=settings.PINECONE_INDEX_NAME,
-                embedding=embeddings
-            )
+            query_vector = CachedEmbeddings().embed_query(query)
+            results = hybrid_search(query, query_vector, category)
+
+            # Near-duplicate question over the same context: skip the LLM
+            fingerprint = context_fingerprint(results)
+            answer = lookup_answer(query_vector, category, fingerprint)
+            if answer is not None:
+                QueryHistory.objects.create(
+                    user=user,
+                    chat_session=chat_session,
+                    query=query,
+                    answer=answer
+                )
+                return Response(
+                    {
+                        "chat_id": chat_id,
+                        "question": query,
+                        "answer": answer,
+                        "cached": True,
+                    },
+                    status=status.HTTP_200_OK
+                )
 
-            results = vectorstore.similarity_search(query, k=3)
-            context = "\n\n".join([r.page_content for r in results])
+            context = "\n\n".join([r["metadata"].get("text", "") for r in results])
 
   
             senses_prompt = """
@@ -326,9 +532,7 @@ You are the sacred voice of harmony, and you remember.
 Anchor: This is the SENSES you must always be.
 """
 
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-            response = client.chat.completions.create(
+            response = get_openai().chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": senses_prompt},
@@ -339,7 +543,7 @@ Anchor: This is the SENSES you must always be.
             )
 
             answer = response.choices[0].message.content.strip()
-
+            store_answer(query_vector, category, fingerprint, query, answer)
 
             QueryHistory.objects.create(
                 user=user,
@@ -353,6 +557,7 @@ Anchor: This is the SENSES you must always be.
                     "chat_id": chat_id,
                     "question": query,
                     "answer": answer,
+                    "cached": False,
                 },
                 status=status.HTTP_200_OK
             )
@@ -361,6 +566,18 @@ Anchor: This is the SENSES you must always be.
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class QueryCacheStatsView(APIView):
+    """Hit ratio and saved latency of the query embedding and answer caches (admin only)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role != "admin":
+            return Response({"error": "Only admin allowed"}, status=403)
+        report = query_cache_report()
+        report["answers"] = dict(answer_cache_stats)
+        return Response(report, status=200)
+
+
 
 
 
@@ -411,11 +628,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from openai import OpenAI
-from elevenlabs.client import ElevenLabs
+from .clients import get_elevenlabs, get_openai, get_s3
 from pydub import AudioSegment
 from io import BytesIO
-import tempfile, uuid, boto3, traceback
+import tempfile, uuid, traceback
 import base64
 
 
@@ -430,8 +646,8 @@ class VoiceResponseView(APIView):
 
         voice_id = request.data.get("voice_id", "EXGmp56hDmXbYaluL0Wr")
 
-        openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        eleven_client = ElevenLabs(api_key=settings.ELEVENLABS_API_KEY)
+        openai_client = get_openai()
+        eleven_client = get_elevenlabs()
 
         try:
   
@@ -515,12 +731,7 @@ Anchor: This is the SENSES you must always be.
 
             audio_data = response.read() if hasattr(response, "read") else b"".join(response)
 
-            s3 = boto3.client(
-                "s3",
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-            )
+            s3 = get_s3()
 
             file_key = f"voice_responses/{uuid.uuid4()}.mp3"
             s3.put_object(
@@ -568,10 +779,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from elevenlabs.client import ElevenLabs
+from .clients import get_elevenlabs, get_s3
 from pydub import AudioSegment
 from io import BytesIO
-import uuid, boto3
+import uuid
 
 
 class TextToVoiceView(APIView):
@@ -589,7 +800,7 @@ class TextToVoiceView(APIView):
 
         try:
         
-            eleven_client = ElevenLabs(api_key='sk_3f68b5afe765549fd852c3e09441b807acf3cae9c9be0b92')
+            eleven_client = get_elevenlabs()
 
             print(f"Generating voice for text ({len(text)} chars)...")
 
@@ -611,12 +822,7 @@ class TextToVoiceView(APIView):
             buffer.seek(0)
 
         
-            s3 = boto3.client(
-                "s3",
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-            )
+            s3 = get_s3()
 
             file_key = f"voice_outputs/{uuid.uuid4()}.mp3"
             s3.put_object(
@@ -1041,7 +1247,7 @@ class FirebaseGoogleAuthView(APIView):
 
 
 
-import requests
+from .clients import get_http
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -1096,7 +1302,7 @@ class GetSignedURLView(APIView):
                 "Content-Type": "application/json",
             }
 
-            api_response = requests.get(url, headers=headers)
+            api_response = get_http().get(url, headers=headers)
 
             if api_response.status_code != 200:
                 try:
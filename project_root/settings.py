@@ -9,6 +9,7 @@ os.environ['AWS_DEFAULT_REGION'] = config('AWS_DEFAULT_REGION', default='us-east
 
 
 import os
+import tempfile
 from pathlib import Path
 from decouple import config
 from dotenv import load_dotenv 
@@ -229,6 +230,22 @@ AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_DEFAULT_ACL = None 
 AWS_S3_VERIFY = True
 
+# Direct-to-S3 multipart uploads
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+UPLOAD_URL_EXPIRES = int(os.getenv("UPLOAD_URL_EXPIRES", "3600"))  # seconds
+# Uploads posted through the API are streamed into S3 in parts of this size
+STREAM_UPLOAD_PART_SIZE = int(os.getenv("STREAM_UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+STREAM_UPLOAD_MAX_IN_FLIGHT = int(os.getenv("STREAM_UPLOAD_MAX_IN_FLIGHT", "2"))
+
+# Shared upstream clients (chatbot/clients.py)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "120"))  # seconds
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "50"))
+UPSTREAM_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+
 
 
 
@@ -254,12 +271,116 @@ MEDIA_ROOT = ""
 # OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 # PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "")
+# Set to skip the describe_index lookup of the data-plane host
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")
+# Use the gRPC transport (requires pinecone[grpc])
+PINECONE_GRPC = os.getenv("PINECONE_GRPC", "false").lower() in ("1", "true", "yes")
+PINECONE_QUERY_CONCURRENCY = int(os.getenv("PINECONE_QUERY_CONCURRENCY", "8"))
+# Upserts are split by vector count and by request size (API limit is 2 MB)
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "100"))
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", str(1536 * 1024)))
+PINECONE_UPSERT_WORKERS = int(os.getenv("PINECONE_UPSERT_WORKERS", "4"))
+PINECONE_UPSERT_RETRIES = int(os.getenv("PINECONE_UPSERT_RETRIES", "3"))
+
+# Vector index: "pinecone", or "local" for the memory-mapped index in
+# VECTOR_STORE_DIR (float16 or int8 rows; see chatbot/vectorstores.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", str(BASE_DIR / "vectorstore"))
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float16")
+
+# Hybrid retrieval for QueryView: vector and BM25 candidates fused by
+# reciprocal-rank fusion; RETRIEVAL_TOP_K chunks go to the LLM
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_VECTOR_THREADS = int(os.getenv("RETRIEVAL_VECTOR_THREADS", "8"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Terms found in more than this share of chunks are ignored
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))
 # ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
+# Embeddings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "512"))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))  # 0 = model default
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+EMBEDDING_CACHE_EVICT_EVERY = int(os.getenv("EMBEDDING_CACHE_EVICT_EVERY", "3600"))  # seconds
+
+# Chunking (measured in embedding-model tokens)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "350"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+# Ingestion
+INGEST_SHARD_CHUNKS = int(os.getenv("INGEST_SHARD_CHUNKS", "256"))  # chunks per embedding task
+INGEST_ARTIFACT_PREFIX = os.getenv("INGEST_ARTIFACT_PREFIX", "ingest")  # S3 prefix for stage outputs
+INGEST_WORK_DIR = os.getenv("INGEST_WORK_DIR", os.path.join(tempfile.gettempdir(), "ingest"))
+INGEST_PAGES_PER_PART = int(os.getenv("INGEST_PAGES_PER_PART", "25"))  # pages per extraction checkpoint
+INGEST_STALE_AFTER = int(os.getenv("INGEST_STALE_AFTER", "1800"))  # seconds without progress
+INGEST_MAX_RESUMES = int(os.getenv("INGEST_MAX_RESUMES", "3"))
+
+# OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_PAGES_PER_TASK = int(os.getenv("OCR_PAGES_PER_TASK", "4"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--oem 1 --psm 3")
+# Per-page text layer quality; pages failing any check are OCR'd
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))
+OCR_MIN_PRINTABLE_RATIO = float(os.getenv("OCR_MIN_PRINTABLE_RATIO", "0.9"))
+OCR_MIN_WHITESPACE_RATIO = float(os.getenv("OCR_MIN_WHITESPACE_RATIO", "0.05"))
+OCR_MAX_WHITESPACE_RATIO = float(os.getenv("OCR_MAX_WHITESPACE_RATIO", "0.5"))
+OCR_MIN_MEAN_RUN_LENGTH = float(os.getenv("OCR_MIN_MEAN_RUN_LENGTH", "2.0"))  # chars between whitespace
+
+# Audio/video transcription
+MEDIA_SEGMENT_SECONDS = int(os.getenv("MEDIA_SEGMENT_SECONDS", "600"))  # target segment length
+MEDIA_SEGMENT_MAX_SECONDS = int(os.getenv("MEDIA_SEGMENT_MAX_SECONDS", "900"))
+MEDIA_BITRATE_KBPS = int(os.getenv("MEDIA_BITRATE_KBPS", "32"))
+MEDIA_SILENCE_DB = int(os.getenv("MEDIA_SILENCE_DB", "-35"))
+MEDIA_SILENCE_SECONDS = float(os.getenv("MEDIA_SILENCE_SECONDS", "0.6"))
+MEDIA_TRANSCRIBE_WORKERS = int(os.getenv("MEDIA_TRANSCRIBE_WORKERS", "6"))
+
 
 # celery settings
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+# Shared state between workers: KB sync debounce flag and lock
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/2")
+
+# ElevenLabs KB sync: processed uploads are collected for KB_SYNC_DEBOUNCE
+# seconds, then synced with one agent update
+KB_SYNC_DEBOUNCE = int(os.environ.get("KB_SYNC_DEBOUNCE", "30"))
+KB_SYNC_MAX_BATCH = int(os.environ.get("KB_SYNC_MAX_BATCH", "50"))
+KB_SYNC_WORKERS = int(os.environ.get("KB_SYNC_WORKERS", "4"))
+KB_SYNC_LOCK_TIMEOUT = int(os.environ.get("KB_SYNC_LOCK_TIMEOUT", "600"))
+
+# Ingestion stages can be split over dedicated worker pools, e.g.
+#   celery -A project_root worker -Q ingest_cpu --concurrency 2
+# All queues default to "celery" so a single worker still runs everything.
+INGEST_QUEUE_IO = os.environ.get("INGEST_QUEUE_IO", "celery")
+INGEST_QUEUE_CPU = os.environ.get("INGEST_QUEUE_CPU", "celery")
+INGEST_QUEUE_EMBED = os.environ.get("INGEST_QUEUE_EMBED", "celery")
+CELERY_TASK_ROUTES = {
+    "chatbot.tasks.ingest_download": {"queue": INGEST_QUEUE_IO},
+    "chatbot.tasks.ingest_extract": {"queue": INGEST_QUEUE_CPU},
+    "chatbot.tasks.ingest_chunk": {"queue": INGEST_QUEUE_CPU},
+    "chatbot.tasks.ingest_embed_shard": {"queue": INGEST_QUEUE_EMBED},
+    "chatbot.tasks.ingest_upsert": {"queue": INGEST_QUEUE_IO},
+    "chatbot.tasks.ingest_kb_sync": {"queue": INGEST_QUEUE_IO},
+    "chatbot.tasks.sync_knowledge_base": {"queue": INGEST_QUEUE_IO},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    "resume-stale-ingestions": {
+        "task": "chatbot.tasks.resume_stale_ingestions",
+        "schedule": 600.0,
+    },
+    "evict-embedding-cache": {
+        "task": "chatbot.tasks.evict_embedding_cache",
+        "schedule": float(EMBEDDING_CACHE_EVICT_EVERY),
+    },
+}
 
 # Static
 STATIC_URL = "/static/"
@@ -285,8 +406,23 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Shared by all web and worker processes (query embedding cache)
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'ignite',
+    },
 }
+
+# Query embedding cache: in-process LRU in front of the shared cache
+QUERY_EMBED_LRU_SIZE = int(os.getenv("QUERY_EMBED_LRU_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL = int(os.getenv("QUERY_EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Semantic answer cache (see chatbot/answer_cache.py); a TTL of 0 disables it
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SCAN_LIMIT = int(os.getenv("ANSWER_CACHE_SCAN_LIMIT", "50"))
 CORS_ALLOW_ALL_ORIGINS = True
 
 EMAIL_BACKEND = config('EMAIL_BACKEND')